@@ -0,0 +1,86 @@
+"""
+Latency and throughput of the web API, fully offline (see `offline.py`),
+against a SQLite database seeded with synthetic datasets.
+
+    PYTHONPATH=. python benchmarks/bench_api.py --datasets 1000000 --output bench/api.json
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+import offline
+
+# Calls before measuring each benchmark
+WARMUP = 10
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        app = offline.setup(workdir)
+
+        start = time.perf_counter()
+        ids, token = offline.seed(app.app, args.datasets)
+        seed_seconds = time.perf_counter() - start
+
+        client = app.app.test_client()
+        auth = {"Authorization": f"Bearer {token}"}
+        order = list(ids)
+        random.Random(offline.SEED).shuffle(order)
+        taken = 0
+
+        def take(n):
+            """IDs for call `i`, `n` at a time, not used by other calls or benchmarks."""
+            nonlocal taken
+            start = taken
+            taken += (args.requests + WARMUP) * n
+            return lambda i: [order[(start + i * n + j) % len(order)] for j in range(n)]
+
+        def endpoint(request, n=1):
+            ids_for = take(n)
+            return lambda i: request(ids_for(i)).status_code
+
+        def uncached_index(ids):
+            app.app.cache.delete("meta/stats")
+            return client.get("/")
+
+        benchmarks = {
+            "index": endpoint(lambda ids: client.get("/")),
+            "index_uncached": endpoint(uncached_index),
+            "view_html": endpoint(lambda ids: client.get(f"/view/sra/{ids[0]}/")),
+            "view_api": endpoint(lambda ids: client.get(f"/v1/view/sra/{ids[0]}")),
+            "compute_sra": endpoint(
+                lambda ids: client.post(f"/v1/compute/sra/{ids[0]}", headers=auth)
+            ),
+            "compute_sra_batch": endpoint(
+                lambda ids: client.post("/v1/compute/sra", json={"ids": ids}, headers=auth),
+                n=args.batch,
+            ),
+        }
+
+        results = {}
+        for name, call in benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = offline.measure(call, args.requests, warmup=WARMUP)
+            results[name]["status_codes"] = results[name].pop("returned")
+
+    offline.write_results({
+        "benchmark": "api",
+        "datasets": args.datasets,
+        "seed_seconds": seed_seconds,
+        "requests": args.requests,
+        "batch": args.batch,
+        "results": results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--datasets", type=int, default=1_000_000)
+    p.add_argument("--requests", type=int, default=1000)
+    p.add_argument("--batch", type=int, default=100, help="IDs per batch compute request")
+    p.add_argument("--only", nargs="*", help="benchmarks to run (default: all)")
+    p.add_argument("--output", help="JSON output (default: stdout)")
+    sys.exit(main(p.parse_args()))
@@ -0,0 +1,102 @@
+"""
+Reads/sec of the compute task on synthetic FASTA, fully offline (see
+`offline.py`). Runs `compute_genomes` eagerly, with the input already in the
+worker input cache and signatures saved to the local storage backend.
+
+    PYTHONPATH=. python benchmarks/bench_compute.py --reads 200000 --processes 1 4
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import offline
+
+
+def write_input(path, n_reads, length, workdir):
+    from bench_sketch import synthetic_fasta
+
+    plain = os.path.join(workdir, "reads.fa")
+    synthetic_fasta(plain, n_reads, length)
+    with open(plain, "rb") as src, gzip.open(path, "wb", compresslevel=1) as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(plain)
+
+
+def run_task(tasks, input_cache, reads, accession, queue):
+    from wort.ext import db
+    from wort.models import Dataset, Task
+
+    os.link(reads, input_cache.path_for(f"{accession}.fna.gz"))
+    db.session.add(Dataset(id=accession, database_id="Genomes",
+                           size_MB=os.path.getsize(reads) // 1000 // 1000))
+    db.session.commit()
+
+    start = time.perf_counter()
+    result = tasks.compute_genomes.apply(
+        args=[accession, f"https://offline.invalid/{accession}.fna.gz", accession],
+        routing_key=queue,
+    )
+    result.get()
+    elapsed = time.perf_counter() - start
+
+    stages = json.loads(Task.query.get(result.id).stages)
+    return elapsed, stages
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        app = offline.setup(workdir)
+        offline.seed(app.app, 0)
+
+        from wort.blueprints.compute import tasks
+        from wort.inputs import get_input_cache
+
+        reads = os.path.join(workdir, "reads.fna.gz")
+        write_input(reads, args.reads, args.length, workdir)
+
+        flask_app = tasks.celery.flask_app
+        results = {}
+        with flask_app.app_context():
+            input_cache = get_input_cache()
+            for processes in args.processes:
+                queue = f"bench{processes}"
+                flask_app.config["SKETCH_PROCESSES"][queue] = processes
+
+                runs = [
+                    run_task(tasks, input_cache, reads, f"GCA_{processes:03d}{n:06d}.1", queue)
+                    for n in range(args.repeat)
+                ]
+                elapsed, stages = min(runs, key=lambda run: run[0])
+                n_reads = stages["sketch"]["reads"]
+                results[f"compute_genomes_p{processes}"] = {
+                    "processes": processes,
+                    "seconds": elapsed,
+                    "reads_per_sec": n_reads / elapsed,
+                    "sketch_reads_per_sec": n_reads / stages["sketch"]["seconds"],
+                    "stages": {
+                        stage: counters.get("seconds", 0.0) for stage, counters in stages.items()
+                    },
+                }
+
+    offline.write_results({
+        "benchmark": "compute",
+        "reads": args.reads,
+        "length": args.length,
+        "repeat": args.repeat,
+        "results": results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--reads", type=int, default=100_000)
+    p.add_argument("--length", type=int, default=150)
+    p.add_argument("--processes", type=int, nargs="+", default=[1, 4])
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--output", help="JSON output (default: stdout)")
+    sys.exit(main(p.parse_args()))
@@ -0,0 +1,70 @@
+"""
+Compare reads/sec of the in-process sketching engine against the
+`sourmash compute` subprocess pipeline previously used by the workers.
+
+    python benchmarks/bench_sketch.py --reads 200000 --length 150
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from wort.sketch import sketch_stream
+
+
+def synthetic_fasta(path, n_reads, length, seed=42):
+    rng = random.Random(seed)
+    # reads sampled from a small "genome", so abundances are > 1
+    genome = "".join(rng.choice("ACGT") for _ in range(max(length * 100, 100_000)))
+    with open(path, "w") as fp:
+        for i in range(n_reads):
+            start = rng.randrange(0, len(genome) - length)
+            fp.write(f">read{i}\n{genome[start:start + length]}\n")
+
+
+def bench_subprocess(path, output):
+    start = time.perf_counter()
+    subprocess.run(
+        f"cat {path} | sourmash compute -k 21,31,51 --scaled 1000 "
+        f"--track-abundance --name bench -o {output} -",
+        shell=True, check=True, capture_output=True, executable="/bin/bash",
+    )
+    return time.perf_counter() - start
+
+
+def bench_inprocess(path, output):
+    start = time.perf_counter()
+    with open(path, "rb") as reads, open(output, "w") as out:
+        sketch_stream(reads, "bench", out)
+    return time.perf_counter() - start
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        reads = os.path.join(tmpdir, "reads.fa")
+        synthetic_fasta(reads, args.reads, args.length)
+
+        results = {"reads": args.reads, "length": args.length}
+        for label, bench in (("subprocess", bench_subprocess), ("inprocess", bench_inprocess)):
+            output = os.path.join(tmpdir, f"{label}.sig")
+            elapsed = min(bench(reads, output) for _ in range(args.repeat))
+            results[label] = {"seconds": elapsed, "reads_per_sec": args.reads / elapsed}
+
+        with open(os.path.join(tmpdir, "subprocess.sig")) as a, \
+             open(os.path.join(tmpdir, "inprocess.sig")) as b:
+            results["identical"] = json.load(a) == json.load(b)
+
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--reads", type=int, default=100_000)
+    p.add_argument("--length", type=int, default=150)
+    p.add_argument("--repeat", type=int, default=3)
+    sys.exit(main(p.parse_args()))
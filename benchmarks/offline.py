@@ -0,0 +1,161 @@
+"""
+Offline stand-ins for the services wort talks to, shared by the benchmarks:
+
+- a SQLite database, seeded with synthetic datasets
+- fakeredis for `wort.ext.redis` and `wort.ext.cache`
+- the local storage backend instead of S3
+- an in-memory Celery broker instead of SQS
+
+`setup` has to run before anything else is imported from wort, since
+modules bind `wort.ext.redis` when they are imported.
+"""
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+SEED = 42
+
+DATABASES = {
+    "SRA": "https://trace.ncbi.nlm.nih.gov/Traces/sra/?run={dataset}",
+    "Genomes": "https://www.ncbi.nlm.nih.gov/assembly/{dataset}",
+    "IMG": "https://img.jgi.doe.gov/cgi-bin/m/main.cgi?taxon_oid={dataset}",
+}
+
+
+def setup(workdir):
+    """Point the settings to `workdir` and return the (connexion) app."""
+    os.environ.update({
+        "DATABASE_URL": "sqlite:///" + os.path.join(workdir, "wort.db"),
+        "STORAGE_BACKEND": "local",
+        "STORAGE_LOCAL_ROOT": os.path.join(workdir, "storage"),
+        "INPUT_CACHE_DIR": os.path.join(workdir, "inputs"),
+        "INPUT_CACHE_QUEUES": "",
+    })
+
+    import fakeredis
+    from cachelib import RedisCache
+
+    import wort.ext
+
+    wort.ext.redis = fakeredis.FakeRedis()
+    wort.ext.cache = RedisCache(host=wort.ext.redis)
+
+    import config.settings
+
+    config.settings.CELERY_CONFIG.update({
+        "broker_url": "memory://",
+        "result_backend": "cache+memory://",
+    })
+
+    from wort.app import create_app
+
+    return create_app()
+
+
+def seed(app, n_datasets, computed=0.9, batch_size=50_000):
+    """
+    Add `n_datasets` synthetic SRA datasets (a fraction of them computed)
+    and a user. Returns the dataset IDs and a token for the user.
+    """
+    from sqlalchemy import insert
+
+    from wort import stats
+    from wort.ext import db
+    from wort.models import Database, Dataset, User
+
+    rng = random.Random(SEED)
+    now = datetime.utcnow()
+
+    with app.app_context():
+        db.create_all()
+        for database_id, link in DATABASES.items():
+            db.session.merge(Database(id=database_id, metadata_link=link))
+
+        ids = [f"SRR{i:08d}" for i in range(1, n_datasets + 1)]
+        for start in range(0, n_datasets, batch_size):
+            db.session.execute(insert(Dataset), [
+                {
+                    "id": dataset_id,
+                    "database_id": "SRA",
+                    "size_MB": rng.randint(1, 20_000),
+                    "computed": now - timedelta(seconds=rng.randint(0, 10 ** 7))
+                    if rng.random() < computed else None,
+                }
+                for dataset_id in ids[start:start + batch_size]
+            ])
+        db.session.commit()
+        stats.resync()
+
+        user = User(username="bench", email="bench@example.org")
+        user.set_password("bench")
+        db.session.add(user)
+        token = user.get_token(expires_in=86400)
+        db.session.commit()
+
+    return ids, token
+
+
+def summarize(latencies, elapsed):
+    """Latency percentiles (ms) and throughput for a list of latencies (s)."""
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(int(p / 100 * len(latencies)), len(latencies) - 1)] * 1000
+
+    return {
+        "requests": len(latencies),
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": latencies[-1] * 1000,
+        "requests_per_sec": len(latencies) / elapsed,
+    }
+
+
+def measure(call, requests, warmup=10):
+    """
+    Call `call(i)` `requests` times, returning `summarize` for the calls and
+    how many times each value was returned by them ("returned").
+    """
+    # warm up with other arguments (`i` from `requests` on), so the measured
+    # calls don't hit caches. Not counted in the results.
+    for i in range(warmup):
+        call(requests + i)
+
+    latencies = []
+    returned = Counter()
+    start = time.perf_counter()
+    for i in range(requests):
+        t = time.perf_counter()
+        returned[call(i)] += 1
+        latencies.append(time.perf_counter() - t)
+    return {**summarize(latencies, time.perf_counter() - start), "returned": dict(returned)}
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results, output=None):
+    """Write results as JSON to `output` (or stdout), tagged with the commit."""
+    results = {"commit": commit(), "date": datetime.utcnow().isoformat(), **results}
+    if output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as fp:
+        json.dump(results, fp, indent=2)
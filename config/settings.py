@@ -9,9 +9,95 @@ SQLALCHEMY_DATABASE_URI = os.path.expandvars(
 )
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Where signatures are stored: "s3" (or S3-compatible, with STORAGE_ENDPOINT_URL)
+# or "local", a directory per bucket under STORAGE_LOCAL_ROOT. Links to local
+# signatures are built from STORAGE_LOCAL_URL, if it is set.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "s3")
+STORAGE_ENDPOINT_URL = os.environ.get("STORAGE_ENDPOINT_URL")
+STORAGE_LOCAL_ROOT = os.environ.get("STORAGE_LOCAL_ROOT", os.path.join(basedir, "storage"))
+STORAGE_LOCAL_URL = os.environ.get("STORAGE_LOCAL_URL")
+
+# Public copy of the signatures, served by the viewer
+SIG_PUBLIC_URL = os.environ.get("SIG_PUBLIC_URL", "https://s3.bi.denbi.de")
 SIG_STORAGE_ACCESS_KEY_ID = os.environ.get("SIG_STORAGE_ACCESS_KEY_ID")
 SIG_STORAGE_SECRET_ACCESS_KEY = os.environ.get("SIG_STORAGE_SECRET_ACCESS_KEY")
 SIG_STORAGE_ENDPOINT_URL = os.environ.get("SIG_STORAGE_ENDPOINT_URL")
+# Connections kept by the (per process) storage client, and how long
+# presigned URLs are valid (seconds)
+SIG_STORAGE_MAX_POOL = int(os.environ.get("SIG_STORAGE_MAX_POOL", 32))
+PRESIGNED_URL_EXPIRES = int(os.environ.get("PRESIGNED_URL_EXPIRES", 900))
+
+# Signatures are gzipped and uploaded in parts of this size (bytes),
+# so worker memory doesn't grow with signature size
+SIG_GZIP_LEVEL = int(os.environ.get("SIG_GZIP_LEVEL", 9))
+SIG_UPLOAD_PART_SIZE = int(os.environ.get("SIG_UPLOAD_PART_SIZE", 8 * 1024 * 1024))
+
+# Largest (uncompressed) signature accepted from users, in bytes
+SUBMIT_MAX_SIZE = int(os.environ.get("SUBMIT_MAX_SIZE", 2 * 1024 * 1024 * 1024))
+
+# Resources a task can use in each queue (memory in MB, runtime in seconds).
+# compute_large takes everything that doesn't fit the others.
+QUEUE_LIMITS = {
+    "compute_small": {"memory_MB": 2000, "runtime": 2 * 3600},
+    "compute_medium": {"memory_MB": 8000, "runtime": 8 * 3600},
+}
+
+# Processes used to sketch a dataset, by queue. Needs a worker pool that can
+# start processes (`--pool solo`), prefork workers always sketch serially.
+SKETCH_PROCESSES = {
+    "compute_small": 1,
+    "compute_medium": int(os.environ.get("SKETCH_PROCESSES_MEDIUM", 2)),
+    "compute_large": int(os.environ.get("SKETCH_PROCESSES_LARGE", 4)),
+}
+
+# Queues a worker also takes tasks from when it had no task for
+# WORKER_IDLE_SECONDS, one task at a time (comma separated, e.g.
+# compute_medium for large workers). See wort/blueprints/compute/drain.py.
+WORKER_DRAIN_QUEUES = [
+    q for q in os.environ.get("WORKER_DRAIN_QUEUES", "").split(",") if q
+]
+WORKER_IDLE_SECONDS = int(os.environ.get("WORKER_IDLE_SECONDS", 60))
+
+# Worker scratch directory for downloaded inputs (.sra, .fna.gz), so retries
+# and recomputes don't download them again. Disabled when unset. Only used
+# for tasks from INPUT_CACHE_QUEUES (comma separated, empty for all queues).
+INPUT_CACHE_DIR = os.environ.get("INPUT_CACHE_DIR")
+INPUT_CACHE_BYTES = int(os.environ.get("INPUT_CACHE_BYTES", 200 * 1000 ** 3))
+INPUT_CACHE_QUEUES = [
+    q for q in os.environ.get("INPUT_CACHE_QUEUES", "compute_large").split(",") if q
+]
+
+# SRA read extraction (wort/blueprints/compute/extract.py): prefetched runs
+# with at least EXTRACT_PARALLEL_MIN_SPOTS spots are split in EXTRACT_THREADS
+# spot ranges extracted in parallel, if the scratch files fit in
+# EXTRACT_SCRATCH_DIR (defaults to INPUT_CACHE_DIR) keeping
+# EXTRACT_SCRATCH_RESERVE bytes free.
+EXTRACT_THREADS = {
+    "compute_medium": int(os.environ.get("EXTRACT_THREADS_MEDIUM", 1)),
+    "compute_large": int(os.environ.get("EXTRACT_THREADS_LARGE", 4)),
+}
+EXTRACT_PARALLEL_MIN_SPOTS = int(os.environ.get("EXTRACT_PARALLEL_MIN_SPOTS", 10_000_000))
+EXTRACT_SCRATCH_DIR = os.environ.get("EXTRACT_SCRATCH_DIR")
+EXTRACT_SCRATCH_RESERVE = int(os.environ.get("EXTRACT_SCRATCH_RESERVE", 20 * 1000 ** 3))
+
+# Local index of computed signatures (see `flask inventory`).
+# Lookups fall back to HEAD requests when unset or older than max age.
+INVENTORY_DIR = os.environ.get("INVENTORY_DIR")
+INVENTORY_MAX_AGE = int(os.environ.get("INVENTORY_MAX_AGE", 2 * 86400))  # seconds
+
+# Working copy of the per-database catalog manifests (see `flask manifest`)
+MANIFEST_DIR = os.environ.get("MANIFEST_DIR")
+
+# efetch-style endpoint for SRA runinfo, queried with `term=<accessions>`
+RUNINFO_URL = os.environ.get(
+    "RUNINFO_URL",
+    "https://trace.ncbi.nlm.nih.gov/Traces/sra/sra.cgi?save=efetch&db=sra&rettype=runinfo",
+)
+
+# Concurrent storage requests when streaming a zip collection, and how long
+# saved selections of datasets are kept (seconds)
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 16))
+SELECTION_TTL = int(os.environ.get("SELECTION_TTL", 7 * 86400))
 
 # Celery SQS
 CELERY_CONFIG = {
@@ -40,4 +126,20 @@ CELERY_CONFIG = {
     },
 
     "broker_heartbeat": None,
+
+    # Messages are only removed from the queue after the task finished,
+    # and a running task keeps its message with a lease (LEASE_* below)
+    "task_acks_late": True,
+    "task_reject_on_worker_lost": True,
+    "worker_prefetch_multiplier": 1,
 }
+
+# While a compute task runs, its message visibility (and dataset claim) is
+# extended to LEASE_TIMEOUT seconds every LEASE_INTERVAL seconds
+LEASE_TIMEOUT = int(os.environ.get("LEASE_TIMEOUT", 1800))
+LEASE_INTERVAL = int(os.environ.get("LEASE_INTERVAL", 600))
+
+# Dataset claims (wort/inflight.py) are kept for INFLIGHT_QUEUE_WAIT seconds
+# more than the visibility timeout, covering the time a task waits in the
+# queue before a worker receives it and starts its lease
+INFLIGHT_QUEUE_WAIT = int(os.environ.get("INFLIGHT_QUEUE_WAIT", 24 * 3600))
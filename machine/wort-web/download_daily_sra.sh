@@ -10,7 +10,7 @@ output_metagenomes=outputs_metagenomes/${day_plain}.csv
 output_metatranscriptomes=outputs_metatranscriptomes/${day_plain}.csv
 
 submit_csv() {
-  docker-compose exec -T web flask shell -c "%run -i machine/wort-web/add_dataset_info.py machine/wort-web/$1"
+  docker-compose exec -T web flask ingest sra machine/wort-web/$1
   pipenv run python submit.py $1 | tee $2/`date +%Y%m%d_%H%M`.submitted
 }
 
@@ -9,30 +9,37 @@ from requests.exceptions import ConnectionError
 filename = sys.argv[1]
 
 microbial = pd.read_table(filename, sep=',', usecols=["Run"])
-SRA_IDS = microbial["Run"]
+SRA_IDS = list(microbial["Run"].dropna().unique())
 
 url  ="https://wort.oxli.org"
 # TODO: read PASSWORD from env?
 
+# Maximum accepted by /v1/compute/sra
+BATCH_SIZE = 5000
+
 token = (requests.post(url + '/v1/auth/tokens',
                       auth=HTTPBasicAuth('luizirber', PASSWORD))
                 .text)
 
-for sra_id in SRA_IDS:
+for start in range(0, len(SRA_IDS), BATCH_SIZE):
+    batch = SRA_IDS[start:start + BATCH_SIZE]
     retry = 3
     while retry:
         try:
-            r = requests.post(f"{url}/v1/compute/sra/{sra_id}",
+            r = requests.post(f"{url}/v1/compute/sra",
+                    json={"ids": batch},
                     headers={'Authorization': f"Bearer {token}"})
             if r.status_code == 401:
                 token = (requests.post(url + '/v1/auth/tokens',
                                       auth=HTTPBasicAuth('luizirber', PASSWORD))
                                 .text)
-                r = requests.post(f"{url}/v1/compute/sra/{sra_id}",
+                r = requests.post(f"{url}/v1/compute/sra",
+                        json={"ids": batch},
                         headers={'Authorization': f"Bearer {token}"})
             try:
-                if 'Signature already calculated' not in r.json():
-                    print(sra_id)
+                for sra_id, status in r.json().items():
+                    if status["status"] != 'Signature already calculated':
+                        print(sra_id)
             except:
                 pass
 
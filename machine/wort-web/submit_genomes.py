@@ -9,30 +9,37 @@ from requests.exceptions import ConnectionError
 filename = sys.argv[1]
 
 genomes = pd.read_table(filename, header=1, usecols=["#assembly_accession"])
-accessions = genomes["#assembly_accession"]
+accessions = list(genomes["#assembly_accession"].dropna().unique())
 
 url  ="https://wort.oxli.org"
 # TODO: read PASSWORD from env
 
+# Maximum accepted by /v1/compute/genomes
+BATCH_SIZE = 5000
+
 token = (requests.post(url + '/v1/auth/tokens',
                       auth=HTTPBasicAuth('luizirber', PASSWORD))
                 .text)
 
-for accession in accessions:
+for start in range(0, len(accessions), BATCH_SIZE):
+    batch = accessions[start:start + BATCH_SIZE]
     retry = 3
     while retry:
         try:
-            r = requests.post(f"{url}/v1/compute/genomes/{accession}",
+            r = requests.post(f"{url}/v1/compute/genomes",
+                    json={"ids": batch},
                     headers={'Authorization': f"Bearer {token}"})
             if r.status_code == 401:
                 token = (requests.post(url + '/v1/auth/tokens',
                                       auth=HTTPBasicAuth('luizirber', PASSWORD))
                                 .text)
-                r = requests.post(f"{url}/v1/compute/genomes/{accession}",
+                r = requests.post(f"{url}/v1/compute/genomes",
+                        json={"ids": batch},
                         headers={'Authorization': f"Bearer {token}"})
             try:
-                if 'Signature already calculated' not in r.json():
-                    print(accession)
+                for accession, status in r.json().items():
+                    if status["status"] != 'Signature already calculated':
+                        print(accession)
             except:
                 pass
 
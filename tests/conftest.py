@@ -0,0 +1,84 @@
+import os
+import tempfile
+
+import pytest
+
+DATABASES = {
+    "SRA": "https://trace.ncbi.nlm.nih.gov/Traces/sra/?run={dataset}",
+    "Genomes": "https://www.ncbi.nlm.nih.gov/assembly/{dataset}",
+    "IMG": "https://img.jgi.doe.gov/cgi-bin/m/main.cgi?taxon_oid={dataset}",
+}
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+# Offline stand-ins: SQLite, fakeredis, local storage and an in-memory Celery
+# broker. This runs before the test modules are imported, since modules bind
+# `wort.ext.redis` (and read the settings) when they are imported.
+if fakeredis is not None:
+    _workdir = tempfile.mkdtemp(prefix="wort-tests-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{_workdir}/wort.db",
+        "STORAGE_BACKEND": "local",
+        "STORAGE_LOCAL_ROOT": os.path.join(_workdir, "storage"),
+    })
+
+    from cachelib import RedisCache
+
+    import wort.ext
+
+    wort.ext.redis = fakeredis.FakeRedis()
+    wort.ext.cache = RedisCache(host=wort.ext.redis)
+
+    import config.settings
+
+    config.settings.CELERY_CONFIG.update({
+        "broker_url": "memory://",
+        "result_backend": "cache+memory://",
+    })
+
+
+@pytest.fixture(scope="session")
+def app():
+    if fakeredis is None:
+        pytest.skip("fakeredis is needed for the app tests")
+
+    from wort.app import create_app
+    from wort.ext import db
+    from wort.models import Database
+
+    app = create_app().app
+    with app.app_context():
+        db.create_all()
+        for database_id, link in DATABASES.items():
+            db.session.merge(Database(id=database_id, metadata_link=link))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture(scope="session")
+def token(app):
+    from wort.ext import db
+    from wort.models import User
+
+    with app.app_context():
+        user = User(username="test", email="test@example.org")
+        db.session.add(user)
+        token = user.get_token(expires_in=86400)
+        db.session.commit()
+    return token
+
+
+@pytest.fixture
+def client(app, token):
+    client = app.test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    return client
@@ -0,0 +1,19 @@
+from wort.blueprints.auth import tokens
+from wort.ext import db
+from wort.models import User
+
+
+def test_revoked_token_is_rejected_everywhere(ctx):
+    user = User(username="revoked", email="revoked@example.org")
+    db.session.add(user)
+    token = user.get_token()
+    db.session.commit()
+    assert tokens.check_token(token).username == "revoked"
+
+    # revoked by another process: the DB and Redis are updated,
+    # nothing local to this process
+    user.revoke_token()
+    db.session.commit()
+    ctx.cache.delete(tokens._key(token))
+
+    assert tokens.check_token(token) is None
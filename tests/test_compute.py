@@ -0,0 +1,65 @@
+from wort import runinfo, stats
+from wort.ext import db
+from wort.models import Dataset
+
+
+def store_runinfo(sra_id, size_MB):
+    # runinfo rows are kept as parsed from the CSV, so every value is a string
+    runinfo.store({sra_id: {"Run": sra_id, "size_MB": size_MB, "bases": "", "spots": ""}})
+    db.session.commit()
+
+
+def test_compute_sra_batch_with_stored_runinfo(ctx, client):
+    store_runinfo("SRR90000001", "123")
+    store_runinfo("SRR90000002", "")
+    before = stats.totals()
+
+    response = client.post("/v1/compute/sra", json={"ids": ["SRR90000001", "SRR90000002"]})
+
+    assert response.status_code == 202
+    assert {s["status"] for s in response.get_json().values()} == {"Submitted"}
+    assert Dataset.query.get("SRR90000001").size_MB == 123
+    assert Dataset.query.get("SRR90000002").size_MB is None
+
+    after = stats.totals()
+    assert after["n_datasets"] == before["n_datasets"] + 2
+    assert after["size_MB"] == before["size_MB"] + 123
+
+
+def test_compute_sra_with_stored_runinfo(ctx, client):
+    store_runinfo("SRR90000003", "2000.0")
+
+    response = client.post("/v1/compute/sra/SRR90000003")
+
+    assert response.status_code == 202
+    assert response.get_json()["status"] == "Submitted"
+    assert Dataset.query.get("SRR90000003").size_MB == 2000
+
+
+def test_resolve_sra_submits_new_datasets(ctx, monkeypatch):
+    from wort.blueprints.compute import tasks
+
+    rows = {"SRR90000004": {"Run": "SRR90000004", "size_MB": "2000", "bases": "", "spots": ""}}
+    monkeypatch.setattr(runinfo, "resolve", lambda sra_ids: rows)
+    sent = {}
+    monkeypatch.setattr(
+        tasks.compute, "apply_async",
+        lambda args, queue, **kwargs: sent.update({args[0]: queue}),
+    )
+
+    tasks.resolve_sra.apply(args=[["SRR90000004"]]).get()
+
+    assert sent == {"SRR90000004": "compute_large"}
+    assert Dataset.query.get("SRR90000004").size_MB == 2000
+
+
+def test_new_datasets_are_not_cached_as_unknown(ctx, client):
+    store_runinfo("SRR90000005", "10")
+
+    status = client.get("/v1/status/sra?ids=SRR90000005").get_json()
+    assert status["SRR90000005"]["status"] == "unknown"
+
+    assert client.post("/v1/compute/sra", json={"ids": ["SRR90000005"]}).status_code == 202
+
+    status = client.get("/v1/status/sra?ids=SRR90000005").get_json()
+    assert status["SRR90000005"]["status"] == "pending"
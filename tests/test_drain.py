@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from celery.worker import state
+
+from wort.blueprints.compute import drain
+
+
+class FakeConsumer:
+    def __init__(self, queues, drain_queues):
+        self.queues = set(queues)
+        self.app = SimpleNamespace(flask_app=SimpleNamespace(config={
+            "WORKER_DRAIN_QUEUES": drain_queues, "WORKER_IDLE_SECONDS": 60,
+        }))
+        self.task_consumer = SimpleNamespace(consuming_from=lambda q: q in self.queues)
+        self.timer = SimpleNamespace(
+            call_repeatedly=lambda interval, fn: SimpleNamespace(cancel=lambda: None)
+        )
+
+    def add_task_queue(self, queue):
+        self.queues.add(queue)
+
+    def cancel_task_queue(self, queue):
+        self.queues.discard(queue)
+
+
+def test_drain_queue_only_while_idle(monkeypatch):
+    consumer = FakeConsumer(["compute_large"], ["compute_medium", "compute_large"])
+    step = drain.DrainWhenIdle(None)
+    step.start(consumer)
+    assert step.queues == ["compute_medium"]
+
+    step.check()
+    assert consumer.queues == {"compute_large"}
+
+    # idle long enough, but a task is reserved
+    step.last_active -= 61
+    monkeypatch.setattr(state, "reserved_requests", {"task"})
+    step.check()
+    assert consumer.queues == {"compute_large"}
+
+    monkeypatch.setattr(state, "reserved_requests", set())
+    step.last_active -= 61
+    step.check()
+    assert consumer.queues == {"compute_large", "compute_medium"}
+
+    # back to its own queues as soon as a task arrives
+    drain.task_received()
+    assert consumer.queues == {"compute_large"}
+    step.check()
+    assert consumer.queues == {"compute_large"}
+
+    step.stop(consumer)
+    assert drain._active is None
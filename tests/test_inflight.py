@@ -0,0 +1,41 @@
+from wort import inflight
+from wort.ext import redis
+
+
+def test_second_claim_gets_the_first_task(ctx):
+    assert inflight.claim("SRR94000001", "task-1") is None
+    assert inflight.claim("SRR94000001", "task-2") == "task-1"
+
+    assert inflight.claim_many({"SRR94000001": "task-3", "SRR94000002": "task-3"}) == {
+        "SRR94000001": "task-1"
+    }
+    assert inflight.claim("SRR94000002", "task-4") == "task-3"
+
+
+def test_claims_outlast_the_queue_wait(ctx):
+    inflight.claim("SRR94000003", "task-1")
+    visibility = ctx.config["CELERY_CONFIG"]["broker_transport_options"]["visibility_timeout"]
+    assert redis.ttl(inflight._key("SRR94000003")) > visibility
+    assert inflight.ttl() == ctx.config["INFLIGHT_QUEUE_WAIT"] + visibility
+
+
+def test_release_only_by_the_holder(ctx):
+    inflight.claim("SRR94000004", "task-1")
+
+    inflight.release("SRR94000004", "task-2")
+    assert inflight.claim("SRR94000004", "task-3") == "task-1"
+
+    inflight.release("SRR94000004", "task-1")
+    assert inflight.claim("SRR94000004", "task-3") is None
+
+
+def test_extend_refreshes_the_ttl(ctx):
+    inflight.claim("SRR94000005", "task-1")
+    key = inflight._key("SRR94000005")
+    redis.expire(key, 10)
+
+    inflight.extend("SRR94000005", "task-2", 1000)
+    assert redis.ttl(key) <= 10
+
+    inflight.extend("SRR94000005", "task-1", 1000)
+    assert 10 < redis.ttl(key) <= 1000
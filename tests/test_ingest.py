@@ -0,0 +1,206 @@
+import io
+import os
+
+from wort import ingest, stats
+from wort.ext import db
+from wort.models import Dataset
+
+
+def test_insert_ignore_returns_inserted_rows(ctx):
+    db.session.add(Dataset(id="SRR92000001", database_id="SRA", size_MB=1))
+    db.session.commit()
+
+    inserted = ingest.insert_ignore(Dataset, [
+        {"id": "SRR92000001", "database_id": "SRA", "size_MB": 5, "ipfs": None},
+        {"id": "SRR92000002", "database_id": "SRA", "size_MB": 7, "ipfs": None},
+    ])
+    db.session.commit()
+
+    assert [m["id"] for m in inserted] == ["SRR92000002"]
+    assert Dataset.query.get("SRR92000001").size_MB == 1
+
+
+def test_ingest_counts_only_inserted_datasets(ctx, monkeypatch):
+    # another ingester adds the first run between the lookup and the insert
+    insert_ignore = ingest.insert_ignore
+
+    def concurrent_insert(model, mappings):
+        db.session.add(Dataset(id="SRR92000003", database_id="SRA", size_MB=100))
+        db.session.flush()
+        return insert_ignore(model, mappings)
+
+    monkeypatch.setattr(ingest, "insert_ignore", concurrent_insert)
+    before = stats.totals()
+
+    report = ingest.ingest_sra(io.StringIO(
+        "Run,size_MB\nSRR92000003,100\nSRR92000004,20\n"
+    ))
+
+    after = stats.totals()
+    assert report.inserted == 1
+    assert after["n_datasets"] == before["n_datasets"] + 1
+    assert after["size_MB"] == before["size_MB"] + 20
+
+
+def test_ingest_sra_twice_inserts_nothing_new(ctx):
+    from wort import runinfo
+    from wort.storage import bucket_for, get_storage, sig_key
+
+    csv_data = (
+        "Run,size_MB\n"
+        "SRR95000001,10\n"
+        "SRR95000002,20\n"
+        "Run,size_MB\n"
+        "SRR95000003,30\n"
+    )
+    before = stats.totals()
+
+    report = ingest.ingest_sra(io.StringIO(csv_data), chunk_size=2)
+    assert (report.rows, report.inserted, report.updated) == (3, 3, 0)
+    assert runinfo.lookup(["SRR95000003"])["SRR95000003"]["size_MB"] == "30"
+
+    # computed in the meantime, found in storage by the next ingest
+    get_storage().put_stream(bucket_for("sra"), sig_key("SRR95000002"), io.BytesIO(b"[]"))
+
+    report = ingest.ingest_sra(io.StringIO(csv_data), chunk_size=2)
+    assert (report.rows, report.inserted, report.updated) == (3, 0, 1)
+    assert Dataset.query.get("SRR95000002").computed is not None
+
+    report = ingest.ingest_sra(io.StringIO(csv_data), chunk_size=2)
+    assert (report.inserted, report.updated) == (0, 0)
+
+    after = stats.totals()
+    assert after["n_datasets"] == before["n_datasets"] + 3
+    assert after["n_computed"] == before["n_computed"] + 1
+    assert after["size_MB"] == before["size_MB"] + 60
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, text=""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+
+class FakeSession:
+    """Responses by (method, url), a list is used in order (the last one repeats)."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url))
+        responses = self.responses.get((method, url), [FakeResponse(404)])
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+
+
+ASSEMBLY_COLUMNS = [
+    "assembly_accession", "organism_name", "infraspecific_name", "asm_name",
+    "ftp_path", "paired_asm_comp", "gbrs_paired_asm",
+]
+
+
+def assembly_summary(accessions):
+    lines = ["##  See ftp://ftp.ncbi.nlm.nih.gov/genomes/README_assembly_summary.txt",
+             "#" + "\t".join(ASSEMBLY_COLUMNS)]
+    for accession in accessions:
+        asm_name = "ASM" + accession[-3]
+        lines.append("\t".join([
+            accession, "Escherichia coli", "", asm_name,
+            f"{ingest.assembly_dir(accession)}/{accession}_{asm_name}", "na", "na",
+        ]))
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+def test_ingest_genomes_resolves_paths_and_is_idempotent(ctx, monkeypatch):
+    accessions = [f"GCA_950000{n:03d}.1" for n in range(1, 5)]
+    paths = {
+        acc: f"{ingest.assembly_dir(acc)}/{acc}_ASM{acc[-3]}/{acc}_ASM{acc[-3]}_genomic.fna.gz"
+        for acc in accessions
+    }
+    listing = ingest.assembly_dir(accessions[2])
+    crawled = f"{listing}/{accessions[2]}_other/{accessions[2]}_other_genomic.fna.gz"
+    session = FakeSession({
+        ("HEAD", paths[accessions[0]]): [FakeResponse(200, {"Content-Length": "5000000"})],
+        # a server error is retried
+        ("HEAD", paths[accessions[1]]): [FakeResponse(503), FakeResponse(200)],
+        # the path from the summary is wrong, the directory listing has the right one
+        ("GET", listing): [
+            FakeResponse(200, text=f'<a href="{accessions[2]}_other/">{accessions[2]}_other/</a>')
+        ],
+        ("HEAD", crawled): [FakeResponse(200, {"Content-Length": "1000000"})],
+        # accessions[3] can't be resolved
+    })
+    monkeypatch.setattr(ingest, "http_session", lambda workers: session)
+    sleeps = []
+    monkeypatch.setattr(ingest.time, "sleep", sleeps.append)
+
+    report = ingest.ingest_genomes(assembly_summary(accessions), chunk_size=3, workers=4)
+
+    assert (report.rows, report.inserted, report.skipped) == (4, 3, 1)
+    # only the server error is retried, not the missing paths
+    assert len(sleeps) == 1
+    assert Dataset.query.get(accessions[0]).size_MB == 5
+    assert Dataset.query.get(accessions[1]).path == paths[accessions[1]]
+    assert Dataset.query.get(accessions[2]).path == crawled
+    assert Dataset.query.get(accessions[3]) is None
+
+    # only the unresolved accession is requested again
+    session.requests.clear()
+    report = ingest.ingest_genomes(assembly_summary(accessions), chunk_size=3, workers=4)
+
+    assert (report.inserted, report.skipped) == (0, 1)
+    assert {url for _, url in session.requests} <= {
+        paths[accessions[3]], ingest.assembly_dir(accessions[3])
+    }
+
+
+def test_ingest_ipfs_resumes_from_checkpoint(ctx, tmp_path):
+    from wort.models import IngestCheckpoint
+
+    for n in (1, 2, 3):
+        db.session.add(Dataset(id=f"SRR96000{n:03d}", database_id="SRA"))
+    db.session.commit()
+
+    path = tmp_path / "hashes.txt"
+    path.write_text(
+        "2021-01-01 QmA wort-sra/sigs/SRR96000001.sig\n"
+        "2021-01-01 QmB SRR96000002.sig\n"
+        "2021-01-01 QmC wort-img/sigs/96000001.sig\n"
+    )
+
+    report = ingest.ingest_ipfs([str(path)], chunk_size=2)
+    assert (report.rows, report.inserted, report.updated) == (3, 1, 2)
+    assert Dataset.query.get("SRR96000001").ipfs == "QmA"
+    assert Dataset.query.get("96000001").database_id == "IMG"
+
+    # new lines (the last one still being written) and a later hash for a
+    # dataset that already has one
+    with open(path, "a") as fp:
+        fp.write("2021-01-02 QmD SRR96000003.sig\n")
+        fp.write("2021-01-02 QmE SRR96000001.sig\n")
+        fp.write("2021-01-02 QmF SRR960")
+
+    report = ingest.ingest_ipfs([str(path)], chunk_size=2)
+    assert (report.rows, report.inserted, report.updated) == (2, 0, 1)
+    assert Dataset.query.get("SRR96000003").ipfs == "QmD"
+    assert Dataset.query.get("SRR96000001").ipfs == "QmA"
+
+    checkpoint = IngestCheckpoint.query.get(os.path.normpath(str(path)))
+    assert checkpoint.offset == path.stat().st_size - len("2021-01-02 QmF SRR960")
+
+    # nothing new
+    report = ingest.ingest_ipfs([str(path)], chunk_size=2)
+    assert report.rows == 0
+
+    # a replaced (shorter) file is read from the start
+    path.write_text("2021-01-03 QmG SRR96000002.sig\n")
+    report = ingest.ingest_ipfs([str(path)], chunk_size=2)
+    assert (report.rows, report.updated) == (1, 0)
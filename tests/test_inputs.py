@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from wort.inputs import LOCK_SUFFIX, InputCache
+
+
+def writer(data):
+    def download(path):
+        with open(path, "wb") as fp:
+            fp.write(data)
+    return download
+
+
+def test_inputs_in_use_are_not_evicted(tmp_path):
+    cache = InputCache(str(tmp_path), max_bytes=10)
+
+    with cache.fetch("a", writer(b"x" * 6)) as (path_a, hit):
+        assert not hit
+        # "a" doesn't leave room for "b", but it is still in use
+        with cache.fetch("b", writer(b"y" * 6), expected_size=6) as (path_b, hit):
+            assert not hit
+            assert os.path.exists(path_a)
+            assert os.path.exists(path_b)
+
+    with cache.fetch("b", writer(b"")) as (path_b, hit):
+        assert hit
+
+    cache.evict(needed=10)
+    assert sorted(os.listdir(tmp_path)) == []
+
+
+def test_failed_downloads_remove_the_lock_file(tmp_path):
+    cache = InputCache(str(tmp_path), max_bytes=10)
+
+    def fail(path):
+        raise OSError("no network")
+
+    with pytest.raises(OSError):
+        with cache.fetch("a", fail):
+            pass
+    assert not os.path.exists(cache.path_for("a") + LOCK_SUFFIX)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,89 @@
+import io
+from datetime import datetime, timezone
+
+from wort.inventory import Inventory
+from wort.storage import LocalStorage
+
+
+def epoch(day):
+    return int(datetime(2024, 1, day, tzinfo=timezone.utc).timestamp())
+
+
+def test_merge_lookup_and_reload(tmp_path):
+    path = str(tmp_path / "sra.idx")
+    inventory = Inventory(path)
+    inventory.merge([("SRR3", epoch(3)), ("SRR1", epoch(1))])
+    # IDs after the indexed ones are appended, others merged in order
+    inventory.merge([("SRR5", epoch(5)), ("SRR4", epoch(4))])
+    inventory.merge([("SRR2", epoch(2)), ("SRR3", epoch(6)), ("ERR1", epoch(7))])
+
+    assert [inventory.ids[i] for i in range(len(inventory))] == [
+        b"ERR1", b"SRR1", b"SRR2", b"SRR3", b"SRR4", b"SRR5"
+    ]
+    inventory.refreshed = 123
+    inventory.save()
+
+    loaded = Inventory(path).load()
+    assert len(loaded) == 6
+    assert loaded.refreshed == 123
+    assert loaded.lookup("SRR3") == datetime(2024, 1, 6, tzinfo=timezone.utc)
+    assert loaded.lookup("ERR1") == datetime(2024, 1, 7, tzinfo=timezone.utc)
+    for missing in ("SRR0", "SRR", "SRR33", "ZRR1", "A"):
+        assert loaded.lookup(missing) is None
+    assert loaded.last_id("SRR") == "SRR5"
+    assert loaded.last_id("ERR") == "ERR1"
+    assert loaded.last_id("DRR") is None
+
+    # merging into a mapped index, and saving it over the mapped file
+    loaded.merge([("SRR6", epoch(8))])
+    loaded.save()
+    assert Inventory(path).load().lookup("SRR6") == datetime(2024, 1, 8, tzinfo=timezone.utc)
+
+
+def test_empty_index(tmp_path):
+    path = str(tmp_path / "sra.idx")
+    Inventory(path).save()
+
+    loaded = Inventory(path).load()
+    assert len(loaded) == 0
+    assert loaded.lookup("SRR1") is None
+    assert not loaded.is_fresh(3600)
+
+
+def test_incremental_refresh_lists_after_the_last_key(tmp_path):
+    storage = LocalStorage(str(tmp_path / "storage"))
+
+    def put(dataset_id):
+        storage.put_stream("wort-sra", f"sigs/{dataset_id}.sig", io.BytesIO(b"[]"))
+
+    for dataset_id in ("SRR1", "SRR3", "ERR1"):
+        put(dataset_id)
+
+    inventory = Inventory(str(tmp_path / "sra.idx"))
+    inventory.refresh(storage, "wort-sra", prefixes=("SRR", "ERR"))
+    refreshed = inventory.refreshed
+    assert len(inventory) == 3
+
+    listed = []
+    list_keys = storage.list
+
+    def spy(bucket, prefix="", start_after=None):
+        for obj in list_keys(bucket, prefix=prefix, start_after=start_after):
+            listed.append(obj.key)
+            yield obj
+
+    storage.list = spy
+    put("SRR4")
+    # sorts before the last key, only found by a full refresh
+    put("SRR2")
+
+    inventory.refreshed = 0
+    inventory.refresh(storage, "wort-sra", prefixes=("SRR", "ERR"), incremental=True)
+    assert listed == ["sigs/SRR4.sig"]
+    assert inventory.lookup("SRR4") is not None
+    assert inventory.lookup("SRR2") is None
+    assert inventory.refreshed == 0
+
+    inventory.refresh(storage, "wort-sra", prefixes=("SRR", "ERR"))
+    assert inventory.lookup("SRR2") is not None
+    assert inventory.refreshed >= refreshed
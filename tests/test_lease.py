@@ -0,0 +1,75 @@
+import time
+
+from wort.blueprints.compute import lease
+
+QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/123456789012/wort-compute_large"
+
+
+class FakeMessage:
+    def __init__(self):
+        self.acknowledged = False
+        self.delivery_info = {
+            "sqs_queue": QUEUE_URL,
+            "sqs_message": {"ReceiptHandle": "receipt"},
+        }
+
+
+class FakeSQS:
+    def __init__(self):
+        self.calls = []
+
+    def change_message_visibility(self, **kwargs):
+        self.calls.append((time.monotonic(), kwargs))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_lease_renews_until_stopped(monkeypatch):
+    sqs = FakeSQS()
+    regions = []
+    monkeypatch.setattr(lease, "_sqs_client", lambda region: regions.append(region) or sqs)
+    renewed = []
+    interval = 0.05
+
+    start = time.monotonic()
+    thread = lease.start(FakeMessage(), "task-1", 1800, interval, lambda: renewed.append(1))
+    wait_for(lambda: len(sqs.calls) >= 3)
+
+    lease.stop("task-1")
+    assert not thread.is_alive()
+    calls = len(sqs.calls)
+    time.sleep(interval * 3)
+    assert len(sqs.calls) == calls
+
+    assert set(regions) == {"us-east-1"}
+    assert len(renewed) == calls
+    assert {tuple(sorted(kwargs.items())) for _, kwargs in sqs.calls} == {
+        (("QueueUrl", QUEUE_URL), ("ReceiptHandle", "receipt"), ("VisibilityTimeout", 1800))
+    }
+    times = [start] + [t for t, _ in sqs.calls]
+    assert all(b - a >= interval * 0.9 for a, b in zip(times, times[1:]))
+
+
+def test_lease_ends_once_acknowledged(monkeypatch):
+    sqs = FakeSQS()
+    monkeypatch.setattr(lease, "_sqs_client", lambda region: sqs)
+    message = FakeMessage()
+
+    thread = lease.start(message, "task-2", 1800, 0.02)
+    wait_for(lambda: sqs.calls)
+    message.acknowledged = True
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert "task-2" not in lease._leases
+
+
+def test_no_lease_for_other_brokers():
+    message = FakeMessage()
+    message.delivery_info = {}
+    assert lease.start(message, "task-3", 1800, 0.01) is None
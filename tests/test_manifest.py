@@ -0,0 +1,38 @@
+import json
+from datetime import datetime, timedelta
+
+from wort import manifest
+from wort.ext import db
+from wort.models import Dataset
+
+
+def signature(name):
+    return json.dumps([{
+        "class": "sourmash_signature",
+        "name": name,
+        "signatures": [{"ksize": 21, "md5sum": "0" * 32, "max_hash": 0, "mins": []}],
+    }]).encode("utf-8")
+
+
+def test_update_catalog_adds_backfilled_datasets(ctx, tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, "SETTLE_TIME", timedelta(0))
+    catalog = manifest.CatalogManifest(str(tmp_path / "genomes.sqlmf"))
+
+    db.session.add(Dataset(id="GCA_900000001.1", database_id="Genomes",
+                           computed=datetime.utcnow()))
+    db.session.add(Dataset(id="GCA_900000002.1", database_id="Genomes"))
+    db.session.commit()
+    assert manifest.update_catalog(catalog, "genomes", signature) == 1
+
+    # computed backfilled from the storage mtime, older than the watermark
+    db.session.bulk_update_mappings(Dataset, [
+        {"id": "GCA_900000002.1", "computed": datetime.utcnow() - timedelta(days=365)}
+    ])
+    db.session.commit()
+    manifest.update_catalog(catalog, "genomes", signature)
+
+    locations = {row["internal_location"] for row in catalog.rows()}
+    assert locations == {
+        manifest.internal_location("GCA_900000001.1"),
+        manifest.internal_location("GCA_900000002.1"),
+    }
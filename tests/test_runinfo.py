@@ -0,0 +1,70 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from wort import runinfo
+
+HEADER = "Run,size_MB,spots,bases"
+
+
+class RunInfoHandler(BaseHTTPRequestHandler):
+    """Runinfo CSV for the accessions in `term`, repeating the header like entrez."""
+
+    def do_GET(self):
+        term = parse_qs(urlparse(self.path).query)["term"][0]
+        self.server.terms.append(term)
+
+        lines = []
+        for n, sra_id in enumerate(term.split(" OR ")):
+            if sra_id.startswith("SRR0"):
+                # unknown to SRA
+                continue
+            lines += [HEADER, f"{sra_id},{n + 10},{n + 100},{n + 1000}", ""]
+        body = "\n".join(lines).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def runinfo_server(ctx, monkeypatch):
+    server = HTTPServer(("127.0.0.1", 0), RunInfoHandler)
+    server.terms = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setitem(ctx.config, "RUNINFO_URL", f"http://127.0.0.1:{server.server_port}/")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_resolve_fetches_in_chunks_and_stores(runinfo_server, monkeypatch):
+    monkeypatch.setattr(runinfo, "CHUNK_SIZE", 2)
+    sra_ids = ["SRR93000001", "SRR93000002", "SRR93000003", "SRR00000004", "SRR93000005"]
+
+    rows = runinfo.resolve(sra_ids)
+
+    assert runinfo_server.terms == [
+        "SRR93000001 OR SRR93000002",
+        "SRR93000003 OR SRR00000004",
+        "SRR93000005",
+    ]
+    # repeated headers are skipped, unknown accessions are left out
+    assert sorted(rows) == ["SRR93000001", "SRR93000002", "SRR93000003", "SRR93000005"]
+    assert rows["SRR93000002"] == {
+        "Run": "SRR93000002", "size_MB": "11", "spots": "101", "bases": "1001"
+    }
+    assert runinfo.size_MB(rows["SRR93000002"]) == 11
+
+    # stored rows are used next time, only the unknown accession is requested
+    assert runinfo.lookup(sra_ids) == rows
+    assert runinfo.resolve(sra_ids) == rows
+    assert runinfo_server.terms[3:] == ["SRR00000004"]
@@ -0,0 +1,52 @@
+import gzip
+import io
+
+import pytest
+import sourmash
+
+from wort.blueprints.submit.signature import InvalidSignature, JSONChecker, SignatureReader
+
+
+def signature_json():
+    mh = sourmash.MinHash(n=0, ksize=21, scaled=1)
+    mh.add_sequence("ACGT" * 20, force=True)
+    return sourmash.save_signatures([sourmash.SourmashSignature(mh, name="test")])
+
+
+def check(data, step=None):
+    checker = JSONChecker()
+    step = step or len(data)
+    for start in range(0, len(data), step):
+        checker.feed(data[start:start + step])
+    checker.close()
+
+
+def test_accepts_signatures():
+    data = signature_json()
+    check(data)
+    check(data, step=1)
+
+    reader = SignatureReader(io.BytesIO(gzip.compress(data)))
+    assert reader.gzipped
+    while reader.read(7):
+        pass
+
+
+@pytest.mark.parametrize("data", [
+    b'["sourmash_signature"]',
+    b'{"x": "\\"sourmash_signature"}',
+    b'{"class": "sourmash_signature"}',
+    b'[{"x": "sourmash_signature"}]',
+    b'[{"class": "sourmash_signature_v2"}]',
+    b'[{"class": "sourmash_signature"}, {"class": "other"}]',
+    b'[{"info": {"class": "sourmash_signature"}}]',
+    b'[{"x": "class", "y": "sourmash_signature"}]',
+    b'[{"class": "sourmash_signature"}, 1]',
+    b'[]',
+    b'[{"class": "sourmash_signature"}] []',
+])
+def test_rejects_other_json(data):
+    with pytest.raises(InvalidSignature):
+        check(data)
+    with pytest.raises(InvalidSignature):
+        check(data, step=1)
@@ -0,0 +1,15 @@
+from wort import stats
+from wort.ext import db
+from wort.models import Database, DatabaseStats
+
+
+def test_record_creates_and_adds_to_counters(ctx):
+    db.session.merge(Database(id="STATS", metadata_link="https://example.org/{dataset}"))
+    db.session.commit()
+
+    stats.record("STATS", datasets=2, size_MB=100)
+    stats.record("STATS", datasets=1, computed=1, size_MB=50)
+    db.session.commit()
+
+    row = DatabaseStats.query.get("STATS")
+    assert (row.n_datasets, row.n_computed, row.size_MB) == (3, 1, 150)
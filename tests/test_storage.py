@@ -0,0 +1,18 @@
+import io
+import os
+import stat
+
+from wort.storage import LocalStorage
+
+
+def test_local_storage_files_follow_umask(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    previous = os.umask(0o022)
+    try:
+        storage.put_stream("wort-sra", "sigs/SRR1.sig", io.BytesIO(b"{}"))
+    finally:
+        os.umask(previous)
+
+    mode = os.stat(tmp_path / "wort-sra" / "sigs" / "SRR1.sig").st_mode
+    assert stat.S_IMODE(mode) == 0o644
+    assert storage.get_stream("wort-sra", "sigs/SRR1.sig").read() == b"{}"
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from wort.ext import db
+from wort.models import Dataset
+
+
+def test_status_tells_pending_from_unknown(ctx, client):
+    db.session.add(Dataset(id="SRR91000001", database_id="SRA", size_MB=10,
+                           computed=datetime(2024, 1, 1)))
+    db.session.add(Dataset(id="SRR91000002", database_id="SRA", size_MB=20))
+    db.session.commit()
+    ids = ["SRR91000001", "SRR91000002", "SRR91000003"]
+
+    # twice, the second time from the cache
+    for _ in range(2):
+        response = client.post("/v1/status/sra", json={"ids": ids})
+        assert response.status_code == 200
+        status = response.get_json()
+        assert status["SRR91000001"]["status"] == "computed"
+        assert status["SRR91000001"]["size_MB"] == 10
+        assert status["SRR91000002"] == {
+            "status": "pending", "computed": None, "size_MB": 20, "ipfs": None
+        }
+        assert status["SRR91000003"] == {
+            "status": "unknown", "computed": None, "size_MB": None, "ipfs": None
+        }
+
+    # pending datasets still can't be viewed
+    assert client.get("/v1/view/sra/SRR91000002").status_code == 404
+    assert client.get("/v1/view/sra/SRR91000001").status_code == 302
+
+
+def test_view_redirects_to_the_stored_id(ctx, client):
+    db.session.add(Dataset(id="SRR91000004", database_id="SRA", size_MB=10,
+                           computed=datetime(2024, 1, 1)))
+    db.session.commit()
+
+    for dataset_id in ("SRR91000004", "srr91000004", "Srr91000004"):
+        response = client.get(f"/v1/view/sra/{dataset_id}")
+        assert response.status_code == 302
+        assert response.location.endswith("/SRR91000004.sig")
@@ -1,15 +1,14 @@
 import connexion
 from celery import Celery
 from flask import current_app, jsonify, render_template, url_for
-from sqlalchemy import func
 
 from wort.blueprints.auth import auth
 from wort.blueprints.compute import compute
 from wort.blueprints.errors import errors
 from wort.blueprints.submit import submit
 from wort.blueprints.viewer import viewer
+from wort.cache import get_dataset_info
 from wort.ext import cache, db, login, migrate
-from wort.models import Database, Dataset
 
 CELERY_TASK_LIST = ["wort.blueprints.compute.tasks"]
 
@@ -35,6 +34,8 @@ def create_celery_app(app=None):
                 return self.run(*args, **kwargs)
 
     celery.Task = ContextTask
+    # for code running outside of tasks, like signal handlers
+    celery.flask_app = app
     return celery
 
 
@@ -64,6 +65,7 @@ def create_app(settings_override=None):
 
     blueprints(app.app)
     extensions(app.app)
+    commands(app.app)
 
     @app.route("/about/")
     def about():
@@ -71,43 +73,36 @@ def create_app(settings_override=None):
 
     @app.route("/")
     def index():
-        n_datasets = current_app.cache.get(f"meta/n_datasets")
-        if n_datasets is None:
-            n_datasets = Dataset.query.count()
-            current_app.cache.set(f"meta/n_datasets", n_datasets, timeout=86400)
+        from wort import stats
 
-        size_TB = current_app.cache.get(f"meta/size_TB")
-        if size_TB is None:
-            size_MB = Dataset.query.with_entities(func.sum(Dataset.size_MB)).first()[0] or 0
-            size_TB = size_MB / 1000. / 1000.
-            current_app.cache.set(f"meta/size_TB", size_TB, timeout=86400)
+        totals = current_app.cache.get("meta/stats")
+        if totals is None:
+            totals = stats.totals()
+            current_app.cache.set("meta/stats", totals, timeout=60)
+
+        n_datasets = totals["n_datasets"]
+        size_TB = totals["size_MB"] / 1000. / 1000.
 
         return render_template("index.html", n_datasets=n_datasets, size_TB=size_TB)
 
+    @app.route("/metrics")
+    def metrics():
+        from wort.metrics import render_prometheus
+
+        body = current_app.cache.get("meta/metrics")
+        if body is None:
+            body = render_prometheus()
+            current_app.cache.set("meta/metrics", body, timeout=60)
+
+        return body, 200, {"Content-Type": "text/plain; version=0.0.4"}
+
     @app.route("/view/")
     def view_base():
         return render_template("view_base.html")
 
     @app.route("/view/<public_db>/<dataset_id>/")
     def view(public_db=None, dataset_id=None):
-        dataset_info = current_app.cache.get(f"{public_db}/{dataset_id}")
-
-        if dataset_info is None:
-            # Not in cache, let's check DB
-            dataset = Dataset.query.filter_by(id=dataset_id).first()
-
-            if dataset is not None and dataset.computed:
-                # Found a hit in DB
-                dataset_info = {}
-                dataset_info["name"] = dataset_id.upper()
-                dataset_info["db"] = public_db.upper()
-                dataset_info["link"] = f"/v1/view/{public_db}/{dataset_id}"
-                dataset_info["metadata"] = dataset.database.metadata_link.format(dataset=dataset_id)
-                if dataset.ipfs is not None:
-                    # only show if IPFS hash is available
-                    dataset_info["ipfs"] = dataset.ipfs
-                # let's update cache
-                current_app.cache.set(f"{public_db}/{dataset_id}", dataset_info)
+        dataset_info = get_dataset_info(public_db, dataset_id)
 
         return render_template("view.html", dataset=dataset_info)
 
@@ -122,6 +117,15 @@ def blueprints(app):
     app.register_blueprint(auth)
 
 
+def commands(app):
+    from wort.commands import ingest_cli, inventory_cli, manifest_cli, stats_cli
+
+    app.cli.add_command(ingest_cli)
+    app.cli.add_command(inventory_cli)
+    app.cli.add_command(manifest_cli)
+    app.cli.add_command(stats_cli)
+
+
 def extensions(app):
     """
     Register 0 or more extensions (mutates the app passed in).
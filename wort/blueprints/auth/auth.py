@@ -6,6 +6,7 @@ from werkzeug.exceptions import Unauthorized
 from wort.ext import db
 from wort.models import User
 
+from . import tokens
 from .errors import error_response
 
 auth = Blueprint("auth", __name__)
@@ -24,18 +25,26 @@ def basic_auth(username, password, required_scopes=None):
 
 
 def get_token():
-    token = g.current_user.get_token(expires_in=86400)
+    user = g.current_user
+    previous = user.token
+    token = user.get_token(expires_in=86400)
     db.session.commit()
+    if previous != token:
+        tokens.invalidate(previous)
     return token
 
 
 def verify_token(token):
-    g.current_user = User.check_token(token) if token else None
+    g.current_user = tokens.check_token(token) if token else None
     if g.current_user is not None:
         return {"sub": g.current_user.username, "scope": ""}
 
 
 def revoke_token():
-    g.current_user.get_token()
+    # with bearer auth the current user is a cached copy
+    user = User.query.get(g.current_user.id)
+    user.revoke_token()
+    db.session.add(user)
     db.session.commit()
+    tokens.invalidate(user.token)
     return jsonify({"status": "OK"}), 204
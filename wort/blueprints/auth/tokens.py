@@ -0,0 +1,67 @@
+"""
+Cache for bearer token verification.
+
+Tokens are looked up by their sha256 hash in Redis, before falling back to
+the database. Entries expire with the token, and are removed when a token is
+replaced or revoked. There is no per-process tier: a revocation has to be
+seen right away by every worker, and the Redis GET is the only round-trip.
+"""
+import hashlib
+from datetime import datetime
+
+from flask import current_app
+
+from wort.models import User
+
+
+class CachedUser:
+    """The parts of `User` needed to serve an authenticated request."""
+
+    def __init__(self, id, username, expiration):
+        self.id = id
+        self.username = username
+        self.token_expiration = expiration
+
+    def __repr__(self):
+        return "<CachedUser {}>".format(self.username)
+
+
+def _key(token):
+    return "token/" + hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _to_user(entry):
+    return CachedUser(entry["id"], entry["username"], datetime.fromtimestamp(entry["expires"]))
+
+
+def check_token(token):
+    """Return a `CachedUser` for a valid token, or None."""
+    key = _key(token)
+    now = datetime.utcnow()
+
+    entry = current_app.cache.get(key)
+    if entry is None:
+        user = User.check_token(token)
+        if user is None:
+            return None
+        entry = {
+            "id": user.id,
+            "username": user.username,
+            "expires": user.token_expiration.timestamp(),
+        }
+        timeout = int((user.token_expiration - now).total_seconds())
+        if timeout > 0:
+            current_app.cache.set(key, entry, timeout=timeout)
+
+    cached = _to_user(entry)
+    if cached.token_expiration < now:
+        invalidate(token)
+        return None
+
+    return cached
+
+
+def invalidate(token):
+    if not token:
+        return
+    current_app.cache.delete(_key(token))
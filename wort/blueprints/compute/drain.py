@@ -0,0 +1,95 @@
+"""
+Take tasks from other queues while a worker is idle.
+
+Celery consumes the queues given with `-Q` round-robin, so a large worker
+listening on `compute_large,compute_medium` would take medium tasks even
+with large tasks waiting. Instead, a worker only listens on its own queues,
+and after `idle` seconds without tasks it also starts consuming from the
+drain queues. It stops again as soon as a task is received, so at most
+one task is taken from a drain queue before its own queues are checked
+again alone, and a drain queue is only used while they stay empty.
+"""
+import logging
+import time
+
+from celery import bootsteps
+from celery.worker import state
+
+logger = logging.getLogger(__name__)
+
+# Seconds between idle checks (at most)
+CHECK_INTERVAL = 5.0
+
+_active = None
+
+
+class DrainWhenIdle(bootsteps.StartStopStep):
+    requires = {"celery.worker.consumer.tasks:Tasks"}
+
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.consumer = None
+        self.queues = []
+        self.idle = 60
+        self.draining = False
+        self.last_active = time.monotonic()
+        self._timer = None
+
+    def start(self, c):
+        global _active
+
+        config = c.app.flask_app.config
+        self.consumer = c
+        self.idle = config["WORKER_IDLE_SECONDS"]
+        self.queues = [
+            q for q in config["WORKER_DRAIN_QUEUES"]
+            if not c.task_consumer.consuming_from(q)
+        ]
+        if not self.queues:
+            return
+
+        self.last_active = time.monotonic()
+        self._timer = c.timer.call_repeatedly(min(CHECK_INTERVAL, self.idle), self.check)
+        _active = self
+        logger.info("Draining %s after %ss idle", ",".join(self.queues), self.idle)
+
+    def stop(self, c):
+        global _active
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if _active is self:
+            _active = None
+
+    def check(self):
+        if state.reserved_requests:
+            self.last_active = time.monotonic()
+            return
+        if self.draining or time.monotonic() - self.last_active < self.idle:
+            return
+        self.draining = True
+        for queue in self.queues:
+            self.consumer.add_task_queue(queue)
+
+    def task_received(self):
+        self.last_active = time.monotonic()
+        if self.draining:
+            self.draining = False
+            for queue in self.queues:
+                self.consumer.cancel_task_queue(queue)
+
+    def task_finished(self):
+        # only called in this process for the solo and threads pools, where
+        # the idle check can't run while a task is executing
+        self.last_active = time.monotonic()
+
+
+def task_received():
+    if _active is not None:
+        _active.task_received()
+
+
+def task_finished():
+    if _active is not None:
+        _active.task_finished()
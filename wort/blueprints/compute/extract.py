@@ -0,0 +1,197 @@
+"""
+Read extraction for SRA runs.
+
+All backends run fastq-dump with the same read filtering and concatenate
+the output in spot order, so the reads (and the signature) don't depend on
+the backend used:
+
+- "stream": fastq-dump on the accession, downloading while extracting.
+- "local": fastq-dump on a prefetched .sra file.
+- "parallel": a prefetched .sra file split in spot ranges, each extracted
+  by its own fastq-dump process. The first range is read directly from
+  its pipe, the others are written to scratch files and read in order
+  once the previous range is consumed.
+
+fasterq-dump is multithreaded, but it can't clip reads or filter by the
+read filter column (no `--clip` or `--read-filter pass`), so its output
+is not the same as fastq-dump's.
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+from subprocess import PIPE, Popen
+
+FASTQ_DUMP = [
+    "fastq-dump", "--disable-multithreading",
+    "--fasta", "0", "--skip-technical", "--readids",
+    "--read-filter", "pass", "--dumpbase", "--split-spot", "--clip",
+]
+
+# Bytes of FASTA headers and newlines per spot (--readids --split-spot),
+# for estimating the scratch space used by the parallel backend
+HEADER_BYTES_PER_SPOT = 64
+# FASTA output size relative to the .sra file, when bases are unknown
+SRA_EXPANSION = 2
+
+
+def fastq_dump_args(source, first=None, last=None):
+    args = list(FASTQ_DUMP)
+    if first is not None:
+        args += ["-N", str(first)]
+    if last is not None:
+        args += ["-X", str(last)]
+    return args + ["-Z", source]
+
+
+def spot_ranges(spots, parts):
+    """
+    Split spots 1..`spots` in `parts` contiguous (first, last) ranges.
+
+    The last range is open ended, so no spot is lost if `spots` (from
+    runinfo) is lower than the number of spots in the .sra file.
+    """
+    parts = max(1, min(parts, spots))
+    step = max(spots // parts, 1)
+    ranges = []
+    for i in range(parts):
+        first = 1 + i * step
+        last = first + step - 1 if i < parts - 1 else None
+        ranges.append((first, last))
+    return ranges
+
+
+def estimate_output_bytes(size_MB=None, bases=None, spots=None):
+    """Size of the FASTA output for a run, or None if unknown."""
+    if bases:
+        return int(bases) + int(spots or 0) * HEADER_BYTES_PER_SPOT
+    if size_MB:
+        return int(size_MB * 1000 * 1000 * SRA_EXPANSION)
+    return None
+
+
+def select_backend(path, threads=1, spots=0, output_bytes=None, scratch_dir=None,
+                   min_spots=0, reserve_bytes=0):
+    """
+    Pick the extraction backend for a run. `path` is the prefetched .sra
+    file (None if there isn't one).
+
+    The parallel backend is used for runs with at least `min_spots` spots
+    when the scratch files fit in `scratch_dir` (keeping `reserve_bytes`
+    free). Only the first of the `threads` ranges doesn't touch the disk.
+    """
+    if path is None:
+        return "stream"
+    if threads <= 1 or not spots or spots < min_spots or output_bytes is None:
+        return "local"
+
+    parts = len(spot_ranges(spots, threads))
+    needed = output_bytes * (parts - 1) // parts
+    free = shutil.disk_usage(scratch_dir or os.path.dirname(path)).free
+    if free - reserve_bytes < needed:
+        return "local"
+    return "parallel"
+
+
+class _ChainedReader(io.RawIOBase):
+    """
+    Read the first range from its pipe, then each scratch file after its
+    fastq-dump process exits. Stops at the first failed range.
+    """
+
+    def __init__(self, first, parts):
+        self.current = first
+        self.parts = list(parts)
+
+    def readable(self):
+        return True
+
+    def _next(self):
+        if not self.parts:
+            return None
+        proc, path = self.parts.pop(0)
+        proc.wait()
+        if proc.returncode != 0:
+            return None
+        fp = open(path, "rb")
+        # free the space as soon as the file is closed
+        os.remove(path)
+        return fp
+
+    def readinto(self, b):
+        while self.current is not None:
+            n = self.current.readinto(b)
+            if n:
+                return n
+            self.current.close()
+            self.current = self._next()
+        return 0
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+class Extraction:
+    """
+    fastq-dump processes extracting the reads for a run, used as a context
+    manager. `stdout` has the reads in the same order as a single fastq-dump
+    over the whole run, `returncode` is set on exit (the first failure).
+    """
+
+    def __init__(self, source, stderr, ranges=None, scratch_dir=None):
+        self.source = source
+        self.stderr = stderr
+        self.ranges = ranges
+        self.scratch_dir = scratch_dir
+        self.procs = []
+        self.stdout = None
+        self._tmpdir = None
+
+    def _start(self, first=None, last=None, stdout=PIPE):
+        proc = Popen(fastq_dump_args(self.source, first, last),
+                     stdout=stdout, stderr=self.stderr)
+        self.procs.append(proc)
+        return proc
+
+    def __enter__(self):
+        if not self.ranges:
+            self.stdout = self._start().stdout
+            return self
+
+        try:
+            (first, last), *others = self.ranges
+            self.stdout = self._start(first, last).stdout
+            self._tmpdir = tempfile.TemporaryDirectory(dir=self.scratch_dir, prefix="wort-extract-")
+            parts = []
+            for n, (first, last) in enumerate(others, 1):
+                path = os.path.join(self._tmpdir.name, f"{n}.fa")
+                with open(path, "wb") as fp:
+                    parts.append((self._start(first, last, stdout=fp), path))
+        except BaseException:
+            self.__exit__(*sys.exc_info())
+            raise
+        self.stdout = _ChainedReader(self.stdout, parts)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            for proc in self.procs:
+                proc.kill()
+        if self.stdout is not None:
+            self.stdout.close()
+        for proc in self.procs:
+            proc.wait()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+        return False
+
+    @property
+    def returncode(self):
+        for proc in self.procs:
+            if proc.returncode:
+                return proc.returncode
+        return 0
@@ -0,0 +1,106 @@
+"""
+Lease renewal for long running tasks.
+
+Tasks are acknowledged late, so the SQS message stays in flight while the
+task runs, and is delivered again if the worker dies. SQS would also
+redeliver it once the visibility timeout expires, even if the task is still
+running. A `Lease` thread extends the message visibility every `interval`
+seconds until the message is acknowledged (or rejected), so slow tasks are
+not duplicated but a crashed worker still releases the message quickly.
+"""
+import logging
+import threading
+from functools import lru_cache
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+_leases = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _sqs_client(region):
+    import boto3
+
+    # own session, the default one isn't safe to share between threads
+    return boto3.session.Session().client("sqs", region_name=region)
+
+
+def _region(queue_url):
+    # https://sqs.<region>.amazonaws.com/<account>/<queue>
+    parts = urlparse(queue_url).netloc.split(".")
+    return parts[1] if len(parts) > 2 and parts[0] == "sqs" else None
+
+
+def sqs_location(message):
+    """Queue URL and receipt handle for a kombu SQS message (or Nones)."""
+    info = message.delivery_info or {}
+    queue_url = info.get("sqs_queue")
+    receipt = (info.get("sqs_message") or {}).get("ReceiptHandle")
+    return queue_url, receipt
+
+
+class Lease(threading.Thread):
+    def __init__(self, message, task_id, timeout, interval, on_renew=None):
+        super().__init__(name=f"lease-{task_id}", daemon=True)
+        self.message = message
+        self.task_id = task_id
+        self.timeout = timeout
+        self.interval = interval
+        self.on_renew = on_renew
+        self.stopped = threading.Event()
+
+    def renew(self):
+        queue_url, receipt = sqs_location(self.message)
+        _sqs_client(_region(queue_url)).change_message_visibility(
+            QueueUrl=queue_url, ReceiptHandle=receipt, VisibilityTimeout=self.timeout
+        )
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                if self.message.acknowledged:
+                    break
+                try:
+                    self.renew()
+                    if self.on_renew is not None:
+                        self.on_renew()
+                except Exception:
+                    # SQS refuses to extend past 12 hours since the message
+                    # was received, nothing else to do then
+                    logger.warning("Couldn't renew lease for task %s", self.task_id, exc_info=True)
+        finally:
+            with _lock:
+                if _leases.get(self.task_id) is self:
+                    del _leases[self.task_id]
+
+    def stop(self):
+        """Stop renewing, waiting for a renewal in progress to finish."""
+        self.stopped.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+
+def start(message, task_id, timeout, interval, on_renew=None):
+    """Keep `message` invisible in the queue while the task is running."""
+    queue_url, receipt = sqs_location(message)
+    if queue_url is None or receipt is None:
+        # not an SQS message (e.g. tests or another broker)
+        return None
+
+    lease = Lease(message, task_id, timeout, interval, on_renew=on_renew)
+    with _lock:
+        previous = _leases.pop(task_id, None)
+        _leases[task_id] = lease
+    if previous is not None:
+        previous.stop()
+    lease.start()
+    return lease
+
+
+def stop(task_id):
+    with _lock:
+        lease = _leases.pop(task_id, None)
+    if lease is not None:
+        lease.stop()
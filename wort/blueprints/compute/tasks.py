@@ -1,16 +1,28 @@
 import gzip
+import logging
 import os
-import shutil
-from io import BytesIO
-import shlex
-from subprocess import run, CalledProcessError
-from tempfile import NamedTemporaryFile
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from tempfile import NamedTemporaryFile, TemporaryFile
 
 from celery.exceptions import Ignore
+from celery.signals import task_postrun, task_received
+from celery.utils import uuid
+from flask import current_app
 
+from wort import cache, inflight, inventory, routing, stats
 from wort.app import create_celery_app
+from wort.blueprints.compute import drain, extract, lease
+from wort.inputs import download_url, get_input_cache, prefetch_sra
+from wort.metrics import TimedReader
+from wort.sketch import make_sketcher
+from wort.storage import bucket_for, get_storage, sig_key
 
 celery = create_celery_app()
+celery.steps["consumer"].add(drain.DrainWhenIdle)
+
+logger = logging.getLogger(__name__)
 
 
 class WorkerRunError(Exception):
@@ -18,138 +30,257 @@ class WorkerRunError(Exception):
 
 
 @celery.task
-def compute(sra_id):
-    import boto3
-    import botocore
-
-    conn = boto3.client("s3")
-    s3 = boto3.resource("s3")
-
-    key_path = os.path.join("sigs", sra_id + ".sig")
-    try:
-        s3.Object("wort-sra", key_path).load()
-    except botocore.exceptions.ClientError as e:
-        if e.response["Error"]["Code"] == "404":
-            pass  # Object does not exist, let's compute it later
-        else:
-            # Something else has gone wrong
-            raise
-
-    else:
+def resolve_sra(sra_ids):
+    from wort import runinfo
+    from wort.blueprints.compute.views import add_sra_datasets
+    from wort.models import Dataset
+
+    rows = runinfo.resolve(sra_ids)
+
+    # Another request might have added some of them in the meantime
+    known = {
+        d.id for d in
+        Dataset.query.with_entities(Dataset.id).filter(Dataset.id.in_(list(rows)))
+    }
+    new_datasets = add_sra_datasets({k: v for k, v in rows.items() if k not in known})
+
+    task_ids = {dataset.id: uuid() for dataset in new_datasets}
+    taken = inflight.claim_many(task_ids)
+    new_datasets = [d for d in new_datasets if d.id not in taken]
+    queues = routing.select_queues(new_datasets)
+
+    with celery.producer_or_acquire() as producer:
+        for dataset in new_datasets:
+            compute.apply_async(
+                args=[dataset.id], queue=queues[dataset.id],
+                task_id=task_ids[dataset.id], producer=producer,
+            )
+
+
+def save_and_upload(sketcher, name, public_db, dataset_id, metrics):
+    with NamedTemporaryFile("w+") as f:
+        with metrics.stage("save"):
+            sketcher.save(f, name)
+            f.flush()
+
+        with open(f.name, "rb") as sig_fp:
+            stats = get_storage().put_stream(
+                bucket_for(public_db),
+                sig_key(dataset_id),
+                sig_fp,
+                compress=True,
+                level=current_app.config["SIG_GZIP_LEVEL"],
+                part_size=current_app.config["SIG_UPLOAD_PART_SIZE"],
+                content_type="application/json",
+            )
+
+    metrics.add("gzip", seconds=stats["gzip_seconds"],
+                bytes_in=stats["bytes_in"], bytes_out=stats["bytes_out"])
+    metrics.add("upload", seconds=stats["upload_seconds"], bytes_in=stats["bytes_out"])
+
+
+def sketch_timed(stream, request, metrics):
+    """
+    Sketch `stream`, splitting the time spent waiting for input (download)
+    from the time spent sketching.
+    """
+    reader = TimedReader(stream)
+    start = time.perf_counter()
+    sketcher = make_sketcher(sketch_processes(request)).consume(reader)
+    elapsed = time.perf_counter() - start
+
+    metrics.add("download", seconds=reader.seconds, bytes_out=reader.bytes)
+    metrics.add("sketch", seconds=elapsed - reader.seconds, bytes_in=reader.bytes,
+                reads=sketcher.n_reads, bases=sketcher.n_bases)
+    return sketcher
+
+
+def mark_computed(public_db, dataset_id):
+    """Record a finished signature in the DB and the catalog counters."""
+    from wort.ext import db
+    from wort.models import Dataset
+
+    dataset = Dataset.query.get(dataset_id)
+    if dataset is None or dataset.computed is not None:
+        return
+
+    dataset.computed = datetime.utcnow()
+    db.session.add(dataset)
+    stats.record(dataset.database_id, computed=1)
+    db.session.commit()
+    cache.invalidate_dataset(public_db, dataset_id)
+
+
+def task_queue(request):
+    return (request.delivery_info or {}).get("routing_key")
+
+
+def sketch_processes(request):
+    """How many processes to use for sketching, based on the task queue."""
+    return current_app.config["SKETCH_PROCESSES"].get(task_queue(request), 1)
+
+
+@contextmanager
+def cached_input(request, name, download, metrics, size_MB=None):
+    """
+    Context manager for the path of an input in the worker input cache
+    (downloading it on a miss), kept until exit. The path is None if the
+    cache is disabled, the input doesn't fit or the download failed (the
+    caller streams it instead).
+    """
+    input_cache = get_input_cache(task_queue(request))
+    if input_cache is None:
+        yield None
+        return
+
+    expected_size = size_MB * 1000 * 1000 if size_MB else None
+    with ExitStack() as stack:
+        with metrics.stage("prefetch"):
+            try:
+                path, hit = stack.enter_context(
+                    input_cache.fetch(name, download, expected_size=expected_size)
+                )
+            except Exception:
+                logger.warning("Couldn't prefetch %s", name, exc_info=True)
+                path = None
+
+        if path is not None:
+            metrics.add("input_cache", hits=int(hit), misses=int(not hit))
+        yield path
+
+
+def dataset_size(dataset_id):
+    from wort.models import Dataset
+
+    dataset = Dataset.query.get(dataset_id)
+    return dataset.size_MB if dataset is not None else None
+
+
+def extraction_for(request, sra_id, path, size_MB, stderr):
+    """Read extraction for a run, see `extract.select_backend`."""
+    from wort import runinfo
+
+    config = current_app.config
+    threads = config["EXTRACT_THREADS"].get(task_queue(request), 1)
+    row = runinfo.lookup([sra_id]).get(sra_id, {}) if path else {}
+    spots = int(row.get("spots") or 0)
+    scratch_dir = None
+    if path is not None:
+        scratch_dir = config["EXTRACT_SCRATCH_DIR"] or os.path.dirname(path)
+
+    backend = extract.select_backend(
+        path, threads, spots,
+        output_bytes=extract.estimate_output_bytes(size_MB, row.get("bases"), spots),
+        scratch_dir=scratch_dir,
+        min_spots=config["EXTRACT_PARALLEL_MIN_SPOTS"],
+        reserve_bytes=config["EXTRACT_SCRATCH_RESERVE"],
+    )
+    logger.info("Extracting %s with the %s backend", sra_id, backend)
+
+    ranges = extract.spot_ranges(spots, threads) if backend == "parallel" else None
+    return extract.Extraction(path or sra_id, stderr, ranges=ranges, scratch_dir=scratch_dir)
+
+
+@celery.task(bind=True)
+def compute(self, sra_id):
+    if inventory.computed_at("sra", sra_id) is not None:
         # The key already exists
         return
 
-    with NamedTemporaryFile("w+b") as f:
-        try:
-            result = run(
-                "set -euo pipefail; "
-                f"fastq-dump --disable-multithreading --fasta 0 --skip-technical --readids --read-filter pass --dumpbase --split-spot --clip -Z {sra_id} | "
-                "sourmash compute -k 21,31,51 "
-                "  --scaled 1000 "
-                "  --track-abundance "
-                f"  --name {sra_id} "
-                f"  -o {f.name} "
-                "  - ",
-                shell=True, capture_output=True, check=True,
-                executable="/bin/bash",
+    with routing.track_resources(self.request, sra_id, "compute") as run, \
+         TemporaryFile("w+b") as stderr:
+        # fastq-dump reads local .sra files the same way as accessions
+        size_MB = dataset_size(sra_id)
+        with cached_input(
+            self.request, f"{sra_id}.sra", lambda path: prefetch_sra(sra_id, path),
+            run.metrics, size_MB=size_MB,
+        ) as path, extraction_for(self.request, sra_id, path, size_MB, stderr) as extraction:
+            sketcher = sketch_timed(extraction.stdout, self.request, run.metrics)
+        returncode = extraction.returncode
+
+        if returncode == 3:
+            # Happens when fastq-dump can't find an accession
+            # (might have been removed, redacted, or never uploaded,
+            #  and in some cases need dbGaP permission, like SRR27017016)
+            # stop further processing.
+            run.skip()
+            return
+
+        stderr.seek(0)
+        if returncode != 0:
+            raise WorkerRunError(
+                f"fastq-dump failed with exit code {returncode}: "
+                f"{stderr.read().decode('utf-8', 'replace')}"
             )
-        except CalledProcessError as e:
-            if e.returncode == 3:
-                # Happens when fastq-dump can't find an accession
-                # (might have been removed, redacted, or never uploaded,
-                #  and in some cases need dbGaP permission, like SRR27017016)
-                # stop further processing.
-                return
-
-            # We ignore SIGPIPE, since it is informational (and makes sense,
-            # it happens because `head` is closed and `fastq-dump` can't pipe
-            # its output anymore. More details:
-            # http://www.pixelbeat.org/programming/sigpipe_handling.html
-            elif e.returncode != 141:
-                raise e
-        else:
-            result = result
-
-        # if file is empty, consider it an error and sift
+
+        # if there are no reads, consider it an error and sift
         # through logs later to figure out better error control
-        if os.stat(f.name).st_size == 0:
-            raise WorkerRunError(result.stdout)
+        if sketcher.n_reads == 0:
+            raise WorkerRunError(
+                f"No reads for {sra_id}: {stderr.read().decode('utf-8', 'replace')}"
+            )
 
-        f.seek(0)
+        save_and_upload(sketcher, sra_id, "sra", sra_id, run.metrics)
 
-        compressed_fp = BytesIO()
-        with gzip.GzipFile(fileobj=compressed_fp, mode="wb") as gz:
-            shutil.copyfileobj(f, gz)
+    mark_computed("sra", sra_id)
 
-        conn.put_object(
-            Body=compressed_fp.getvalue(),
-            Bucket="wort-sra",
-            Key=key_path,
-            ContentType="application/json",
-            ContentEncoding="gzip",
-        )
 
+@celery.task(bind=True)
+def compute_genomes(self, accession, path, name):
+    import requests
 
-@celery.task
-def compute_genomes(accession, path, name):
-    import boto3
-    import botocore
-
-    conn = boto3.client("s3")
-    s3 = boto3.resource("s3")
-
-    key_path = os.path.join("sigs", accession + ".sig")
-    try:
-        s3.Object("wort-genomes", key_path).load()
-    except botocore.exceptions.ClientError as e:
-        if e.response["Error"]["Code"] == "404":
-            pass  # Object does not exist, let's compute it later
-        else:
-            # Something else has gone wrong
-            raise
-
-    else:
+    if inventory.computed_at("genomes", accession) is not None:
         # The key already exists
         return
 
-    with NamedTemporaryFile("w+b") as f:
-        try:
-            result = run(
-                "set -euo pipefail; "
-                "sourmash compute -k 21,31,51 "
-                "  --scaled 1000 "
-                "  --track-abundance "
-                f"  --name {shlex.quote(name)} "
-                f"  -o {f.name} "
-                f"  <(curl {path} | zcat)",
-                shell=True, capture_output=True, check=True,
-                executable="/bin/bash",
-            )
-        except CalledProcessError as e:
-            # We ignore SIGPIPE, since it is informational (and makes sense,
-            # it happens because `head` is closed and `fastq-dump` can't pipe
-            # its output anymore. More details:
-            # http://www.pixelbeat.org/programming/sigpipe_handling.html
-            if e.returncode != 141:
-                raise e
-        else:
-            result = result
-
-        # if file is empty, consider it an error and sift
+    with routing.track_resources(self.request, accession, "compute_genomes") as run:
+        with cached_input(
+            self.request, f"{accession}.fna.gz", lambda p: download_url(path, p),
+            run.metrics, size_MB=dataset_size(accession),
+        ) as local_path:
+            if local_path is not None:
+                with gzip.open(local_path, "rb") as reads:
+                    sketcher = sketch_timed(reads, self.request, run.metrics)
+            else:
+                with requests.get(path, stream=True, timeout=60) as response:
+                    response.raise_for_status()
+                    with gzip.GzipFile(fileobj=response.raw) as reads:
+                        sketcher = sketch_timed(reads, self.request, run.metrics)
+
+        # if there are no sequences, consider it an error and sift
         # through logs later to figure out better error control
-        if os.stat(f).st_size == 0:
-            raise WorkerRunError(result.stdout)
-
-        f.seek(0)
-
-        compressed_fp = BytesIO()
-        with gzip.GzipFile(fileobj=compressed_fp, mode="wb") as gz:
-            shutil.copyfileobj(f, gz)
-
-        conn.put_object(
-            Body=compressed_fp.getvalue(),
-            Bucket="wort-genomes",
-            Key=key_path,
-            ContentType="application/json",
-            ContentEncoding="gzip",
-        )
+        if sketcher.n_reads == 0:
+            raise WorkerRunError(f"No sequences in {path}")
+
+        save_and_upload(sketcher, name, "genomes", accession, run.metrics)
+
+    mark_computed("genomes", accession)
+
+
+@task_received.connect
+def start_lease(request=None, **kwargs):
+    # runs in the worker main process, also with prefork pools
+    drain.task_received()
+    if request.name not in (compute.name, compute_genomes.name):
+        return
+
+    config = celery.flask_app.config
+    timeout = config["LEASE_TIMEOUT"]
+    dataset_id = request.args[0] if request.args else None
+
+    def on_renew():
+        if dataset_id is not None:
+            inflight.extend(dataset_id, request.id, timeout)
+
+    lease.start(request.message, request.id, timeout, config["LEASE_INTERVAL"], on_renew)
+
+
+@task_postrun.connect
+def release_inflight(sender=None, task_id=None, args=None, **kwargs):
+    # runs after success or failure. If the worker dies the claim is kept
+    # until it expires, since the message will be delivered again.
+    drain.task_finished()
+    if sender in (compute, compute_genomes):
+        lease.stop(task_id)
+        if args:
+            inflight.release(args[0], task_id)
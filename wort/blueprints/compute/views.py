@@ -1,15 +1,63 @@
-import csv
+from collections import defaultdict
 
+from celery.utils import uuid
 from flask import Blueprint, current_app, jsonify, render_template, url_for
-import requests
 
+from wort import cache, inflight, inventory, routing, runinfo, stats
 from wort.ext import db
 from wort.models import Dataset, Database
 
 compute = Blueprint("compute", __name__, template_folder="templates")
 
+# Runinfo resolution happens in a worker, any of them can pick it up
+METADATA_QUEUE = "compute_small"
+
+
+def add_sra_datasets(rows):
+    """
+    Insert datasets for runinfo rows (a mapping of accession to row).
+
+    Returns transient `Dataset` objects for the new rows.
+    """
+    mappings = [
+        {"id": row["Run"], "database_id": "SRA",
+         "size_MB": runinfo.size_MB(row), "ipfs": None}
+        for row in rows.values()
+    ]
+    db.session.bulk_insert_mappings(Dataset, mappings)
+    stats.record(
+        "SRA", datasets=len(mappings),
+        size_MB=sum(m["size_MB"] or 0 for m in mappings),
+    )
+    db.session.commit()
+    # status requests made before might have cached them as missing
+    cache.invalidate_datasets("sra", [m["id"] for m in mappings])
+    return [Dataset(**m) for m in mappings]
+
+
+def request_metadata(sra_ids):
+    """Resolve runinfo in a worker, which then submits the compute tasks."""
+    from . import tasks
+
+    return tasks.resolve_sra.apply_async(args=[sra_ids], queue=METADATA_QUEUE)
+
 
-TRACE_DATA_URL = 'https://trace.ncbi.nlm.nih.gov/Traces/sra/sra.cgi?save=efetch&db=sra&rettype=runinfo&term={dataset}'
+def submit_task(task, dataset_id, args, queue):
+    """
+    Send a task to `queue`, unless there is one queued or running already
+    for this dataset. Returns the response for the request.
+    """
+    task_id = uuid()
+    existing = inflight.claim(dataset_id, task_id)
+    if existing is not None:
+        return jsonify({"status": "Already submitted", "task_id": existing}), 202
+
+    try:
+        task.apply_async(args=args, queue=queue, task_id=task_id)
+    except Exception:
+        inflight.release(dataset_id, task_id)
+        raise
+    return jsonify({"status": "Submitted", "task_id": task_id}), 202
 
 
 def compute_sra(sra_id, recompute=False):
@@ -17,16 +65,15 @@ def compute_sra(sra_id, recompute=False):
 
     dataset = Dataset.query.filter_by(id=sra_id).first()
     if dataset is None:
-        # We don't have information about it, query SRA and insert it
-        # TODO: deal with errors
-        #db = Database.query.filter_by(id="SRA").first()
-        #rawdata = requests.get(db.metadata_link.format(dataset=sra_id)).content.decode("utf-8")
-        rawdata = requests.get(TRACE_DATA_URL.format(dataset=sra_id)).content.decode("utf-8")
-        data = list(csv.DictReader(rawdata.splitlines(), delimiter=","))
-        row = data[0]
-        dataset = Dataset(id=row["Run"], database_id="SRA", size_MB=row["size_MB"], ipfs=None)
-        db.session.add(dataset)
-        db.session.commit()
+        # We don't have information about it, check if runinfo was already
+        # fetched, otherwise let a worker query SRA (and submit the compute
+        # task) instead of blocking this request on NCBI
+        rows = runinfo.lookup([sra_id])
+        if not rows:
+            task = request_metadata([sra_id])
+            return jsonify({"status": "Metadata requested", "task_id": task.id}), 202
+
+        dataset = Dataset.query.get(add_sra_datasets(rows)[0].id)
 
     up_to_date = False
     if not recompute:
@@ -34,30 +81,17 @@ def compute_sra(sra_id, recompute=False):
             up_to_date = True
 
         if dataset.computed is None:
-            # check on S3 to see if it was computed and not updated in DB
-            import boto3
-            import botocore
-            conn = boto3.client("s3")
-            s3 = boto3.resource("s3")
-
-            key_path = f"sigs/{sra_id}.sig"
-            try:
-                obj = s3.Object("wort-sra", key_path)
-                obj.load()
-            except botocore.exceptions.ClientError as e:
-                if e.response["Error"]["Code"] == "404":
-                    pass  # Object does not exist yet
-                else:
-                    # Something else has gone wrong
-                    raise
-            else:
+            # check storage to see if it was computed and not updated in DB
+            computed = inventory.computed_at("sra", sra_id)
+            if computed is not None:
                 # The key already exists, update compute field in DB
-                dataset.computed = obj.last_modified
+                dataset.computed = computed
                 db.session.add(dataset)
+                stats.record(dataset.database_id, computed=1)
                 db.session.commit()
                 # Remove from cache, will be refreshed from DB next time
                 # there is a view request for it
-                current_app.cache.delete(f"sra/{sra_id}")
+                cache.invalidate_dataset("sra", sra_id)
 
                 up_to_date = True
 
@@ -67,21 +101,17 @@ def compute_sra(sra_id, recompute=False):
     if recompute:
         # Force recomputation of sketch,
         # clean status from DB and remove from cache
+        if dataset.computed is not None:
+            stats.record(dataset.database_id, computed=-1)
         dataset.computed = None
         db.session.add(dataset)
         db.session.commit()
-        current_app.cache.delete(f"sra/{sra_id}")
+        cache.invalidate_dataset("sra", sra_id)
 
     # Not computed yet, send to proper queue
-    if dataset.size_MB <= 300:
-        queue = "compute_small"
-    elif dataset.size_MB > 300 and dataset.size_MB < 1600:
-        queue = "compute_medium"
-    else:
-        queue = "compute_large"
+    queue = routing.select_queue(dataset)
 
-    task = tasks.compute.apply_async(args=[sra_id], queue=queue)
-    return jsonify({"status": "Submitted", "task_id": task.id}), 202
+    return submit_task(tasks.compute, sra_id, [sra_id], queue)
 
 
 def compute_genomes(assembly_accession):
@@ -97,15 +127,109 @@ def compute_genomes(assembly_accession):
         return jsonify({"status": "Signature already calculated"}), 202
 
     # Not computed yet, send to proper queue
-    if dataset.size_MB <= 300:
-        queue = "compute_small"
-    elif dataset.size_MB > 300 and dataset.size_MB < 1600:
-        queue = "compute_medium"
-    else:
-        queue = "compute_large"
-
-    task = tasks.compute_genomes.apply_async(
-        args=[dataset.id, dataset.path, dataset.name],
-        queue="genomes")
-#        queue=queue)
-    return jsonify({"status": "Submitted", "task_id": task.id}), 202
+    queue = routing.select_queue(dataset)
+
+    return submit_task(
+        tasks.compute_genomes, dataset.id, [dataset.id, dataset.path, dataset.name], queue
+    )
+
+
+def _submit_batch(task, datasets, task_args, status):
+    """
+    Enqueue tasks grouped by queue, reusing one broker producer.
+
+    Datasets with a task already queued or running are not submitted again.
+    """
+    task_ids = {dataset.id: uuid() for dataset in datasets}
+    for dataset_id, existing in inflight.claim_many(task_ids).items():
+        status[dataset_id] = {"status": "Already submitted", "task_id": existing}
+    datasets = [d for d in datasets if d.id not in status]
+
+    queues = routing.select_queues(datasets)
+    by_queue = defaultdict(list)
+    for dataset in datasets:
+        by_queue[queues[dataset.id]].append(dataset)
+
+    with task.app.producer_or_acquire() as producer:
+        for queue, queued in by_queue.items():
+            for dataset in queued:
+                task_id = task_ids[dataset.id]
+                try:
+                    task.apply_async(
+                        args=task_args(dataset), queue=queue,
+                        task_id=task_id, producer=producer,
+                    )
+                except Exception:
+                    inflight.release(dataset.id, task_id)
+                    raise
+                status[dataset.id] = {"status": "Submitted", "task_id": task_id}
+
+
+def compute_sra_batch(body):
+    from . import tasks
+
+    sra_ids = list(dict.fromkeys(body["ids"]))
+    status = {}
+
+    datasets = {
+        d.id: d for d in Dataset.query.filter(Dataset.id.in_(sra_ids)).all()
+    }
+
+    missing = [sra_id for sra_id in sra_ids if sra_id not in datasets]
+    if missing:
+        # Use runinfo we already have, and resolve the rest in a worker
+        rows = runinfo.lookup(missing)
+        for dataset in add_sra_datasets(rows):
+            datasets[dataset.id] = dataset
+
+        unresolved = [sra_id for sra_id in missing if sra_id not in rows]
+        if unresolved:
+            task = request_metadata(unresolved)
+            for sra_id in unresolved:
+                status[sra_id] = {"status": "Metadata requested", "task_id": task.id}
+
+    to_submit = []
+    for sra_id in sra_ids:
+        dataset = datasets.get(sra_id)
+        if sra_id in status:
+            continue
+        elif dataset is None:
+            status[sra_id] = {"status": "Metadata not available"}
+        elif dataset.computed is not None:
+            status[sra_id] = {"status": "Signature already calculated"}
+        else:
+            # Unlike compute_sra we don't probe S3 here: the task checks
+            # storage before doing any work, so a stale DB entry only costs
+            # an (almost) empty task.
+            to_submit.append(dataset)
+
+    _submit_batch(tasks.compute, to_submit, lambda d: [d.id], status)
+
+    return jsonify(status), 202
+
+
+def compute_genomes_batch(body):
+    from . import tasks
+
+    accessions = list(dict.fromkeys(body["ids"]))
+    status = {}
+
+    datasets = {
+        d.id: d for d in Dataset.query.filter(Dataset.id.in_(accessions)).all()
+    }
+
+    to_submit = []
+    for accession in accessions:
+        dataset = datasets.get(accession)
+        if dataset is None:
+            status[accession] = {"status": "Metadata not available"}
+        elif dataset.computed is not None:
+            status[accession] = {"status": "Signature already calculated"}
+        else:
+            to_submit.append(dataset)
+
+    _submit_batch(
+        tasks.compute_genomes, to_submit, lambda d: [d.id, d.path, d.name], status
+    )
+
+    return jsonify(status), 202
@@ -0,0 +1,200 @@
+"""
+Incremental checks for submitted signatures.
+
+Submissions are streamed to storage, so they are validated while they are
+read: `SignatureReader` wraps the upload, detects gzip from the magic bytes
+and feeds the (decompressed) JSON to `JSONChecker`, which raises
+`InvalidSignature` as soon as the data can't be a signature file (a JSON
+array of signature objects, as written by `sourmash sketch`).
+"""
+import re
+import zlib
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+SIGNATURE_CLASS = b"sourmash_signature"
+# Longest string kept for the keys (and class) of each signature
+CAPTURE_SIZE = 64
+
+_TOKENS = re.compile(rb'["\\\[\]{}]|[^\s"\\\[\]{}]+')
+_STRING_TOKENS = re.compile(rb'["\\]')
+_PAIRS = {ord("]"): ord("["), ord("}"): ord("{")}
+
+
+class InvalidSignature(ValueError):
+    pass
+
+
+class JSONChecker:
+    """
+    Structural JSON check (balanced brackets and strings, a single top level
+    array) in constant memory. Every element of the array has to be an
+    object with `"class": "sourmash_signature"`.
+    """
+
+    def __init__(self):
+        self.stack = bytearray()
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.done = False
+        self.signatures = 0
+
+        # members of the signature being read: strings at depth 2 are keys
+        # after `{` or `,`, and the value of the last key otherwise
+        self.expect_key = False
+        self.key = None
+        self.has_class = False
+        self.capture = None
+        self.capture_key = False
+
+    def _capture(self, data):
+        if self.capture is not None and len(self.capture) < CAPTURE_SIZE:
+            self.capture += data[:CAPTURE_SIZE - len(self.capture)]
+
+    def _end_string(self):
+        if self.capture is None:
+            return
+        value = bytes(self.capture)
+        self.capture = None
+        if self.capture_key:
+            self.key = value
+            self.expect_key = False
+        elif value == SIGNATURE_CLASS:
+            self.has_class = True
+
+    def feed(self, data):
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if self.escape:
+                self.escape = False
+                # kept escaped, "class" written with escapes isn't recognised
+                self._capture(b"\\" + data[pos:pos + 1])
+                pos += 1
+                continue
+
+            if self.in_string:
+                match = _STRING_TOKENS.search(data, pos)
+                if match is None:
+                    self._capture(data[pos:])
+                    return
+                self._capture(data[pos:match.start()])
+                pos = match.end()
+                if match.group() == b"\\":
+                    self.escape = True
+                else:
+                    self.in_string = False
+                    self._end_string()
+                continue
+
+            match = _TOKENS.search(data, pos)
+            if match is None:
+                return
+            pos = match.end()
+            token = match.group()[0]
+            depth = len(self.stack)
+
+            if self.done:
+                raise InvalidSignature("Unexpected data after the end of the JSON document")
+
+            if not self.started:
+                if token != ord("["):
+                    raise InvalidSignature("Expected a JSON array of signatures")
+                self.started = True
+
+            if token == ord('"'):
+                if depth == 1:
+                    raise InvalidSignature("Expected a JSON array of signatures")
+                self.in_string = True
+                if depth == 2 and (self.expect_key or self.key == b"class"):
+                    self.capture = bytearray()
+                    self.capture_key = self.expect_key
+            elif token in b"[{":
+                if depth == 1:
+                    if token != ord("{"):
+                        raise InvalidSignature("Expected a JSON array of signatures")
+                    self.expect_key = True
+                    self.key = None
+                    self.has_class = False
+                self.stack.append(token)
+            elif token in b"]}":
+                if not self.stack or self.stack.pop() != _PAIRS[token]:
+                    raise InvalidSignature("Unbalanced brackets in JSON")
+                if depth == 2:
+                    if not self.has_class:
+                        raise InvalidSignature("Not a sourmash signature")
+                    self.signatures += 1
+                if not self.stack:
+                    self.done = True
+            elif not self.stack:
+                raise InvalidSignature("Unexpected data outside the JSON document")
+            elif depth == 1 and match.group().strip(b","):
+                raise InvalidSignature("Expected a JSON array of signatures")
+            elif depth == 2 and b"," in match.group():
+                self.expect_key = True
+                self.key = None
+
+    def close(self):
+        if not self.done or self.in_string:
+            raise InvalidSignature("Incomplete JSON document")
+        if not self.signatures:
+            raise InvalidSignature("No signatures")
+
+
+class SignatureReader:
+    """
+    File-like wrapper validating an upload as it is read. `gzipped` tells
+    if the data is already compressed (and can be stored as is).
+    """
+
+    def __init__(self, fp, max_size=None):
+        self.fp = fp
+        self.max_size = max_size
+        self.checker = JSONChecker()
+        self.bytes = 0
+        self.decompressed = 0
+
+        self._head = fp.read(len(GZIP_MAGIC))
+        self.gzipped = self._head == GZIP_MAGIC
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if self.gzipped else None
+        self._closed = False
+
+    def _check(self, data):
+        if self._decompressor is not None:
+            while data:
+                # bound the memory used for highly compressible input
+                chunk = self._decompressor.decompress(data, 1024 * 1024)
+                self._feed(chunk)
+                data = self._decompressor.unconsumed_tail
+        else:
+            self._feed(data)
+
+    def _feed(self, data):
+        self.decompressed += len(data)
+        if self.max_size is not None and self.decompressed > self.max_size:
+            raise InvalidSignature("Signature too large")
+        self.checker.feed(data)
+
+    def read(self, size=-1):
+        if self._head:
+            if size is None or size < 0:
+                data = self._head + self.fp.read()
+            else:
+                data = self._head + self.fp.read(max(size - len(self._head), 0))
+            self._head = b""
+        else:
+            data = self.fp.read(size)
+
+        if data:
+            self.bytes += len(data)
+            try:
+                self._check(data)
+            except zlib.error as e:
+                raise InvalidSignature(f"Invalid gzip data: {e}")
+        elif not self._closed:
+            self._closed = True
+            if self._decompressor is not None and not self._decompressor.eof:
+                raise InvalidSignature("Truncated gzip data")
+            self.checker.close()
+        return data
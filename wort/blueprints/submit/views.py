@@ -1,8 +1,9 @@
-import gzip
-import shutil
-from io import BytesIO
+from flask import Blueprint, current_app, g, jsonify, request
 
-from flask import Blueprint, g, jsonify, request
+from wort.blueprints.auth.errors import bad_request
+from wort.storage import get_storage, submitted_bucket_for
+
+from .signature import InvalidSignature, SignatureReader
 
 submit = Blueprint("submit", __name__, template_folder="templates")
 
@@ -12,25 +13,25 @@ def submit_sigs(public_db, dataset_id):
     if public_db not in ("sra", "img"):
         return "Database not supported", 404
 
-    import boto3
-
-    conn = boto3.client("s3")
-
     username = g.current_user.username
     key = f"{username}/{dataset_id}.sig"
 
     file = request.files["file"]
-    compressed_fp = BytesIO()
-    # TODO: if it's already gzipped, don't compress it
-    with gzip.GzipFile(fileobj=compressed_fp, mode="wb") as gz:
-        shutil.copyfileobj(file.stream, gz)
-
-    conn.put_object(
-        Body=compressed_fp.getvalue(),
-        Bucket=f"wort-submitted-{public_db}",
-        Key=key,
-        ContentType="application/json",
-        ContentEncoding="gzip",
-    )
+    reader = SignatureReader(file.stream, max_size=current_app.config["SUBMIT_MAX_SIZE"])
+    try:
+        # Already gzipped data is stored as is. Either way the upload is
+        # validated and sent in parts while it is read.
+        get_storage().put_stream(
+            submitted_bucket_for(public_db),
+            key,
+            reader,
+            compress=not reader.gzipped,
+            level=current_app.config["SIG_GZIP_LEVEL"],
+            part_size=current_app.config["SIG_UPLOAD_PART_SIZE"],
+            content_type="application/json",
+            content_encoding="gzip",
+        )
+    except InvalidSignature as e:
+        return bad_request(str(e))
 
     return jsonify({"status": "Signature accepted"}), 202
@@ -1,34 +1,55 @@
-from flask import Blueprint, current_app, jsonify, redirect, render_template
+import gzip
+import io
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from uuid import uuid4
+from zipfile import ZIP_STORED, ZipFile
 
-viewer = Blueprint("viewer", __name__, template_folder="templates")
+from flask import Blueprint, Response, current_app, jsonify, redirect, render_template, request
 
-# @viewer.route("/view/<db>/<dataset_id>")
-def view_s3(public_db, dataset_id):
+from wort import manifest
+from wort.cache import LocalLRU, get_dataset_info, get_datasets_info
+from wort.ext import redis
+from wort.storage import bucket_for, get_storage, sig_key
 
-    if public_db not in ("sra", "img", "genomes"):
-        return "Database not supported", 404
+viewer = Blueprint("viewer", __name__, template_folder="templates")
 
-    import boto3
+# Presigned URLs are reused for most of their validity window
+_presigned = LocalLRU(maxsize=10000, ttl=3600)
 
-    conn = boto3.client(
-        service_name="s3",
-        endpoint_url=current_app.config["SIG_STORAGE_ENDPOINT_URL"],
-        aws_access_key_id=current_app.config["SIG_STORAGE_ACCESS_KEY_ID"],
-        aws_secret_access_key=current_app.config["SIG_STORAGE_SECRET_ACCESS_KEY"],
-        region_name="auto",
-    )
 
-    key = f"sigs/{dataset_id}.sig"
+def presigned_url(public_db, dataset_id):
+    key = (public_db, dataset_id)
+    url = _presigned.get(key)
+    if url is not None:
+        return url
 
     params = {
-        "Bucket": f"wort-{public_db}",
-        "Key": key,
         "ResponseContentType": "application/json",
         "ResponseContentEncoding": "gzip",
         "ResponseContentDisposition": f'attachment; filename="{dataset_id}.sig"',
     }
 
-    url = conn.generate_presigned_url("get_object", Params=params, ExpiresIn=100)
+    expires = current_app.config["PRESIGNED_URL_EXPIRES"]
+    url = get_storage(public=True).presign(
+        bucket_for(public_db), sig_key(dataset_id), expires, **params
+    )
+    if url is None:
+        return None
+    # leave enough time for the client to follow the redirect
+    _presigned.set(key, url, ttl=int(expires * 0.8))
+    return url
+
+
+# @viewer.route("/view/<db>/<dataset_id>")
+def view_s3(public_db, dataset_id):
+
+    if public_db not in ("sra", "img", "genomes"):
+        return "Database not supported", 404
+
+    url = presigned_url(public_db, dataset_id)
+    if url is None:
+        return "Signature links not available", 404
 
     return redirect(url)
 
@@ -38,23 +59,231 @@ def view(public_db, dataset_id):
     if public_db not in ("sra", "img", "genomes"):
         return "Database not supported", 404
 
-    # Check if we have the info in cache
-    dataset_info = current_app.cache.get(f"{public_db}/{dataset_id}")
-    if dataset_info is None:
-        # Not in cache, let's check DB
-        from wort.models import Dataset
-
-        dataset_info = Dataset.query.filter_by(id=dataset_id).first()
+    # Check if we have the info in cache (or load it from the DB)
+    dataset_info = get_dataset_info(public_db, dataset_id)
 
     if dataset_info is not None:
-        # Found a hit in DB or cache
-
-        # TODO: need to check for dataset_info.computed to see if we
-        #       actually have a signature before redirecting!
+        # Found a hit in DB or cache, and the signature was computed
 
         # sigs in de.NBI are public, so we don't need to create a presigned URL
         # return view_s3(public_db, dataset_id)
 
-        return redirect(f"https://s3.bi.denbi.de/wort-{public_db}/sigs/{dataset_id}.sig")
+        # the stored ID, `dataset_id` might not match its case
+        public_url = current_app.config["SIG_PUBLIC_URL"]
+        return redirect(
+            f"{public_url}/{bucket_for(public_db)}/{sig_key(dataset_info['name'])}"
+        )
 
     return "Dataset not found", 404
+
+
+def _status(public_db, dataset_ids, format):
+    if public_db not in ("sra", "img", "genomes"):
+        return "Database not supported", 404
+
+    infos = get_datasets_info(public_db, dataset_ids)
+    status = {}
+    for dataset_id, info in infos.items():
+        if info is None:
+            state = "unknown"
+        elif info["computed"] is None:
+            state = "pending"
+        else:
+            state = "computed"
+        info = info or {}
+        status[dataset_id] = {
+            "status": state,
+            "computed": info.get("computed"),
+            "size_MB": info.get("size_MB"),
+            "ipfs": info.get("ipfs"),
+        }
+
+    if format is None and request.accept_mimetypes.best == "application/x-ndjson":
+        format = "ndjson"
+
+    if format == "ndjson":
+        lines = (
+            json.dumps({"id": dataset_id, **s}) + "\n"
+            for dataset_id, s in status.items()
+        )
+        return Response(lines, mimetype="application/x-ndjson")
+
+    return jsonify(status)
+
+
+def status(public_db, ids, format=None):
+    return _status(public_db, ids, format)
+
+
+def status_batch(public_db, body, format=None):
+    return _status(public_db, body["ids"], format)
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Output for ZipFile, drained after each entry is written.
+
+    ZipFile seeks back to fill in entry headers, which is allowed within the
+    part not yet drained. That way entries don't need data descriptors,
+    which some readers (including sourmash) don't support.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.base = 0
+        self.pos = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.base + self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.tell()
+        elif whence == io.SEEK_END:
+            offset += self.base + len(self.buffer)
+        if offset < self.base:
+            raise io.UnsupportedOperation("can't seek into data already sent")
+        self.pos = offset - self.base
+        return offset
+
+    def write(self, data):
+        end = self.pos + len(data)
+        self.buffer[self.pos:end] = data
+        self.pos = end
+        return len(data)
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.base += len(self.buffer)
+        self.buffer = bytearray()
+        self.pos = 0
+        return data
+
+
+def fetch_concurrently(fetch, keys, workers):
+    """
+    Yield (key, fetch(key)) in completion order, with at most 2 * workers
+    fetches pending so memory doesn't grow with the number of keys.
+    """
+    keys = iter(keys)
+    executor = ThreadPoolExecutor(workers)
+    try:
+        pending = set()
+
+        def submit(n):
+            for key in keys:
+                future = executor.submit(fetch, key)
+                future.key = key
+                pending.add(future)
+                n -= 1
+                if n == 0:
+                    return
+
+        submit(2 * workers)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                yield future.key, future.result()
+            submit(len(done))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_collection(fetch, dataset_ids, workers):
+    """
+    Generate a sourmash zip collection (signatures plus manifest), one
+    chunk per signature. The archive is never fully held in memory.
+    """
+    output = _StreamBuffer()
+    rows = []
+    with ZipFile(output, "w", ZIP_STORED) as zf:
+        for dataset_id, data in fetch_concurrently(fetch, dataset_ids, workers):
+            if data is None:
+                continue
+
+            if data[:2] != b"\x1f\x8b":
+                data = gzip.compress(data)
+
+            location = f"signatures/{dataset_id}.sig.gz"
+            rows.extend(manifest.rows_from_json(manifest.load_json(data), location))
+            zf.writestr(location, data)
+            yield output.drain()
+
+        text = io.StringIO()
+        manifest.write_csv(text, rows)
+        zf.writestr("SOURMASH-MANIFEST.csv", text.getvalue())
+    yield output.drain()
+
+
+def _download(public_db, dataset_ids):
+    if public_db not in ("sra", "img", "genomes"):
+        return "Database not supported", 404
+
+    infos = get_datasets_info(public_db, dataset_ids)
+    available = [
+        info["name"] for info in infos.values()
+        if info is not None and info["computed"] is not None
+    ]
+
+    workers = current_app.config["DOWNLOAD_WORKERS"]
+    storage = get_storage(public=True)
+    bucket = bucket_for(public_db)
+
+    def fetch(dataset_id):
+        fp = storage.get_stream(bucket, sig_key(dataset_id))
+        if fp is None:
+            return None
+        with fp:
+            return fp.read()
+
+    return Response(
+        stream_collection(fetch, available, workers),
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="wort-{public_db}.zip"',
+            "X-Wort-Missing": str(len(infos) - len(available)),
+        },
+    )
+
+
+def download(public_db, body):
+    return _download(public_db, body["ids"])
+
+
+def _selection_key(selection_id):
+    return f"selection/{selection_id}"
+
+
+def create_selection(public_db, body):
+    if public_db not in ("sra", "img", "genomes"):
+        return "Database not supported", 404
+
+    selection_id = uuid4().hex
+    redis.set(
+        _selection_key(selection_id),
+        json.dumps({"db": public_db, "ids": list(dict.fromkeys(body["ids"]))}),
+        ex=current_app.config["SELECTION_TTL"],
+    )
+    return jsonify({
+        "selection": selection_id,
+        "download": f"/v1/download/{public_db}/{selection_id}",
+    }), 201
+
+
+def download_selection(public_db, selection_id):
+    selection = redis.get(_selection_key(selection_id))
+    if selection is None:
+        return "Selection not found", 404
+
+    selection = json.loads(selection)
+    if selection["db"] != public_db:
+        return "Selection not found", 404
+
+    return _download(public_db, selection["ids"])
@@ -0,0 +1,246 @@
+"""
+Two-tier cache for dataset information.
+
+A small per-process LRU sits in front of the shared Redis cache
+(`wort.ext.cache`). Missing or not yet computed datasets are cached too,
+for a short time and only in Redis, so repeated requests for them don't
+reach the database.
+Datasets not computed yet are cached with their information (`computed`
+is None), so they can be told apart from unknown IDs.
+Concurrent misses for the same key are coalesced: only one process loads
+from the database, the others wait for the value to show up in Redis.
+
+Keys are versioned and normalised (lowercase database, uppercase ID), so
+every view reads and invalidates the same entry.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from wort.ext import cache, redis
+
+VERSION = "v3"
+
+# Stored for missing / uncomputed datasets
+_MISSING = {"missing": True}
+
+
+def dataset_key(public_db, dataset_id):
+    return f"{VERSION}/{public_db.lower()}/{dataset_id.upper()}"
+
+
+class LocalLRU:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+class TieredCache:
+    def __init__(self, shared, maxsize=10000, local_ttl=30, ttl=86400,
+                 negative_ttl=300, lock_timeout=10, wait=2.0, volatile=None):
+        self.shared = shared
+        self.local = LocalLRU(maxsize, local_ttl)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+        # values which are likely to change soon, cached for `negative_ttl`
+        self.volatile = volatile
+
+    def _timeout(self, value):
+        if value is _MISSING or (self.volatile is not None and self.volatile(value)):
+            return self.negative_ttl
+        return self.ttl
+
+    def _set_local(self, key, value):
+        # missing and volatile values are only kept in Redis, where
+        # invalidating them (once they are added) reaches every process
+        if self._timeout(value) == self.ttl:
+            self.local.set(key, value)
+
+    def _store(self, key, value):
+        self.shared.set(key, value, timeout=self._timeout(value))
+        self._set_local(key, value)
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for `key`, calling `loader` on a miss.
+
+        `loader` returns None for missing values, which are cached for
+        `negative_ttl` seconds (as are `volatile` values).
+        """
+        value = self.local.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is not None:
+                self._set_local(key, value)
+
+        if value is None:
+            value = self._load_once(key, loader)
+
+        return None if value == _MISSING else value
+
+    def get_or_load_many(self, keys, loader):
+        """
+        Bulk version of `get_or_load`. `loader` is called once with the keys
+        missing from both tiers, and returns a mapping of key to value (or None).
+
+        Misses are not coalesced with concurrent loads: a single bulk query
+        is cheaper than waiting on many locks.
+        """
+        values = {}
+        for key in keys:
+            value = self.local.get(key)
+            if value is not None:
+                values[key] = value
+
+        remaining = [k for k in keys if k not in values]
+        if remaining:
+            for key, value in zip(remaining, self.shared.get_many(*remaining)):
+                if value is not None:
+                    self._set_local(key, value)
+                    values[key] = value
+
+        missing = [k for k in keys if k not in values]
+        if missing:
+            loaded = {k: v or _MISSING for k, v in loader(missing).items()}
+            by_timeout = {}
+            for key, value in loaded.items():
+                by_timeout.setdefault(self._timeout(value), {})[key] = value
+            for timeout, group in by_timeout.items():
+                self.shared.set_many(group, timeout=timeout)
+            for key, value in loaded.items():
+                self._set_local(key, value)
+            values.update(loaded)
+
+        return {k: None if values[k] == _MISSING else values[k] for k in keys}
+
+    def _load_once(self, key, loader):
+        lock = f"lock/{key}"
+        if redis.set(lock, 1, nx=True, ex=self.lock_timeout):
+            try:
+                value = loader() or _MISSING
+                self._store(key, value)
+                return value
+            finally:
+                redis.delete(lock)
+
+        # Someone else is loading it, wait for it to show up
+        deadline = time.monotonic() + self.wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = self.shared.get(key)
+            if value is not None:
+                self._set_local(key, value)
+                return value
+
+        # Took too long, load it ourselves
+        return loader() or _MISSING
+
+    def invalidate(self, *keys):
+        self.local.delete(*keys)
+        self.shared.delete_many(*keys)
+
+
+datasets = TieredCache(cache, volatile=lambda info: info.get("computed") is None)
+
+
+def _dataset_info(public_db, dataset):
+    dataset_info = {}
+    dataset_info["name"] = dataset.id
+    dataset_info["db"] = public_db.upper()
+    dataset_info["link"] = f"/v1/view/{public_db.lower()}/{dataset.id}"
+    dataset_info["metadata"] = dataset.database.metadata_link.format(dataset=dataset.id)
+    dataset_info["computed"] = dataset.computed.isoformat() if dataset.computed else None
+    dataset_info["size_MB"] = dataset.size_MB
+    if dataset.ipfs is not None:
+        # only show if IPFS hash is available
+        dataset_info["ipfs"] = dataset.ipfs
+    return dataset_info
+
+
+def get_dataset_info(public_db, dataset_id):
+    """Information about a computed dataset, or None if it is missing or not computed."""
+    from wort.models import Dataset
+
+    dataset_id = dataset_id.upper()
+
+    def load():
+        dataset = Dataset.query.filter_by(id=dataset_id).first()
+        if dataset is None:
+            return None
+        return _dataset_info(public_db, dataset)
+
+    info = datasets.get_or_load(dataset_key(public_db, dataset_id), load)
+    if info is None or info["computed"] is None:
+        return None
+    return info
+
+
+def get_datasets_info(public_db, dataset_ids):
+    """
+    Information about many datasets: one Redis MGET, and one database query
+    for the misses. Returns a mapping of ID to info, or None for unknown IDs.
+    Unlike `get_dataset_info`, datasets not computed yet are included (with
+    `computed` set to None).
+    """
+    from sqlalchemy.orm import joinedload
+
+    from wort.models import Dataset
+
+    dataset_ids = list(dict.fromkeys(d.upper() for d in dataset_ids))
+    keys = {dataset_key(public_db, d): d for d in dataset_ids}
+
+    def load(missing_keys):
+        ids = [keys[k] for k in missing_keys]
+        found = (
+            Dataset.query.options(joinedload(Dataset.database))
+            .filter(Dataset.id.in_(ids))
+            .all()
+        )
+        loaded = {
+            dataset_key(public_db, d.id): _dataset_info(public_db, d)
+            for d in found
+        }
+        return {k: loaded.get(k) for k in missing_keys}
+
+    values = datasets.get_or_load_many(list(keys), load)
+    return {keys[k]: v for k, v in values.items()}
+
+
+def invalidate_datasets(public_db, dataset_ids):
+    """Remove datasets from the cache, in a single round-trip."""
+    keys = [dataset_key(public_db, dataset_id) for dataset_id in dataset_ids]
+    if keys:
+        datasets.invalidate(*keys)
+
+
+def invalidate_dataset(public_db, dataset_id):
+    invalidate_datasets(public_db, [dataset_id])
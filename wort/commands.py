@@ -0,0 +1,163 @@
+import click
+from flask.cli import AppGroup
+
+from wort import ingest
+from wort import inventory as inv
+from wort import manifest as mf
+from wort import stats
+from wort.storage import get_storage
+
+inventory_cli = AppGroup("inventory", help="Manage the local storage inventory index.")
+stats_cli = AppGroup("stats", help="Manage the catalog statistics.")
+ingest_cli = AppGroup("ingest", help="Load dataset metadata into the database.")
+manifest_cli = AppGroup("manifest", help="Export sourmash manifests of the catalog.")
+
+
+@inventory_cli.command("refresh")
+@click.argument("public_db", type=click.Choice(sorted(inv.BUCKETS)))
+@click.option("--prefix", "prefixes", multiple=True,
+              help="List these key prefixes concurrently (e.g. SRR, ERR, DRR)")
+@click.option("--incremental", is_flag=True,
+              help="Only list keys after the last indexed one of each prefix")
+def inventory_refresh(public_db, prefixes, incremental):
+    """Update the index from a bucket listing."""
+    inventory = inv.get_inventory(public_db)
+    if inventory is None:
+        raise click.ClickException("INVENTORY_DIR is not set")
+
+    before = len(inventory)
+    inventory.refresh(
+        get_storage(), inv.BUCKETS[public_db], prefixes=prefixes or ("",),
+        incremental=incremental,
+    )
+    inventory.save()
+    click.echo(f"{public_db}: {len(inventory)} signatures ({len(inventory) - before} new)")
+
+
+@inventory_cli.command("ingest-manifest")
+@click.argument("public_db", type=click.Choice(sorted(inv.BUCKETS)))
+@click.argument("bucket")
+@click.argument("manifest_key")
+def inventory_ingest_manifest(public_db, bucket, manifest_key):
+    """Update the index from an S3 Inventory report."""
+    inventory = inv.get_inventory(public_db)
+    if inventory is None:
+        raise click.ClickException("INVENTORY_DIR is not set")
+
+    before = len(inventory)
+    if inventory.ingest_manifest(get_storage(), bucket, manifest_key):
+        inventory.save()
+    click.echo(f"{public_db}: {len(inventory)} signatures ({len(inventory) - before} new)")
+
+
+@stats_cli.command("resync")
+def stats_resync():
+    """Recompute the per-database counters from the dataset table."""
+    for database_id, n_datasets, n_computed, size_MB in stats.resync():
+        click.echo(f"{database_id}: {n_datasets} datasets, {n_computed} computed, {size_MB} MB")
+
+
+@ingest_cli.command("sra")
+@click.argument("runinfo", type=click.File("r"), nargs=-1, required=True)
+@click.option("--chunk-size", default=ingest.CHUNK_SIZE, show_default=True)
+def ingest_sra(runinfo, chunk_size):
+    """Add datasets from runinfo CSV files."""
+    for fp in runinfo:
+        report = ingest.ingest_sra(fp, chunk_size=chunk_size)
+        click.echo(f"{fp.name}: {report}")
+
+
+@ingest_cli.command("genomes")
+@click.argument("assembly_summary", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-size", default=ingest.CHUNK_SIZE, show_default=True)
+@click.option("--workers", default=ingest.GENOME_WORKERS, show_default=True,
+              help="Concurrent requests when resolving download paths")
+def ingest_genomes(assembly_summary, chunk_size, workers):
+    """Add datasets from an assembly_summary.txt(.gz) file."""
+    import gzip
+
+    opener = gzip.open if assembly_summary.endswith(".gz") else open
+    with opener(assembly_summary, "rt") as fp:
+        report = ingest.ingest_genomes(fp, chunk_size=chunk_size, workers=workers)
+    click.echo(f"{assembly_summary}: {report}")
+
+
+@ingest_cli.command("ipfs")
+@click.argument("paths", type=click.Path(exists=True, dir_okay=False), nargs=-1)
+@click.option("--chunk-size", default=ingest.CHUNK_SIZE, show_default=True)
+def ingest_ipfs(paths, chunk_size):
+    """Add IPFS hashes, reading only lines added since the last run."""
+    from glob import glob
+
+    # newer files first, their hashes take precedence
+    paths = paths or reversed(sorted(glob("machine/wort-web/hashes/wort_hashes*")))
+    report = ingest.ingest_ipfs(paths, chunk_size=chunk_size)
+    click.echo(str(report))
+
+
+@manifest_cli.command("export")
+@click.argument("public_db", type=click.Choice(sorted(mf.DATABASES)))
+@click.option("--publish/--no-publish", default=True, show_default=True,
+              help="Upload a versioned snapshot to the database bucket")
+@click.option("--workers", default=16, show_default=True,
+              help="Concurrent signature downloads")
+def manifest_export(public_db, publish, workers):
+    """Add newly computed datasets to the manifest, and publish a snapshot."""
+    import io
+    import json
+    import os
+    import tempfile
+
+    from flask import current_app
+
+    manifest_dir = current_app.config["MANIFEST_DIR"]
+    if manifest_dir is None:
+        raise click.ClickException("MANIFEST_DIR is not set")
+    os.makedirs(manifest_dir, exist_ok=True)
+
+    bucket = inv.BUCKETS[public_db]
+    storage = get_storage()
+
+    def fetch(dataset_id):
+        fp = storage.get_stream(bucket, mf.internal_location(dataset_id))
+        if fp is None:
+            return None
+        with fp:
+            return fp.read()
+
+    catalog = mf.CatalogManifest(os.path.join(manifest_dir, f"{public_db}.sqlmf"))
+    try:
+        added = mf.update_catalog(catalog, public_db, fetch, workers=workers)
+        click.echo(f"{public_db}: {added} datasets added, {len(catalog)} sketches")
+        if not publish:
+            return
+
+        version = mf.snapshot_version()
+        prefix = f"manifests/{version}"
+        with tempfile.TemporaryDirectory(dir=manifest_dir) as tmpdir:
+            sqlmf = os.path.join(tmpdir, "manifest.sqlmf")
+            catalog.snapshot(sqlmf)
+            with open(sqlmf, "rb") as fp:
+                storage.put_stream(bucket, f"{prefix}/manifest.sqlmf", fp,
+                                   content_type="application/vnd.sqlite3")
+
+            csv_path = os.path.join(tmpdir, "manifest.csv")
+            with open(csv_path, "w", newline="") as fp:
+                catalog.write_csv(fp)
+            with open(csv_path, "rb") as fp:
+                storage.put_stream(bucket, f"{prefix}/manifest.csv.gz", fp,
+                                   compress=True, content_type="text/csv")
+
+        latest = {
+            "version": version,
+            "sketches": len(catalog),
+            "watermark": catalog.watermark.isoformat() if catalog.watermark else None,
+            "csv": f"{prefix}/manifest.csv.gz",
+            "sqlite": f"{prefix}/manifest.sqlmf",
+        }
+        storage.put_stream(bucket, "manifests/latest.json",
+                           io.BytesIO(json.dumps(latest).encode("utf-8")),
+                           content_type="application/json")
+        click.echo(f"{public_db}: published {prefix}")
+    finally:
+        catalog.close()
@@ -2,10 +2,12 @@ from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from cachelib import RedisCache
+from redis import Redis
 
 login = LoginManager()
 
 db = SQLAlchemy()
 migrate = Migrate()
 
-cache = RedisCache(host="redis")
+redis = Redis(host="redis")
+cache = RedisCache(host=redis)
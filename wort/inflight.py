@@ -0,0 +1,92 @@
+"""
+Registry of compute tasks that are queued or running, keyed by dataset ID.
+
+A dataset is claimed (atomically, with SET NX) before its task is sent to
+the queue, so concurrent requests for the same dataset get the task ID of
+the first one instead of starting another task. Claims are released when
+the task finishes.
+
+Claims expire after the expected time in the queue (INFLIGHT_QUEUE_WAIT)
+plus the visibility timeout, and are extended by the lease once a worker
+receives the task. A task waiting in the queue for longer loses its claim,
+and a new request for the dataset sends a duplicate task (which only costs
+a storage check if the first one already finished).
+"""
+from flask import current_app
+
+from wort.ext import redis
+
+PREFIX = "inflight/"
+
+# Only delete the claim if it still belongs to this task
+_RELEASE = redis.register_script(
+    """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("del", KEYS[1])
+    end
+    return 0
+    """
+)
+
+# Only extend the claim if it still belongs to this task
+_EXTEND = redis.register_script(
+    """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("expire", KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+)
+
+
+def _key(dataset_id):
+    return f"{PREFIX}{dataset_id}"
+
+
+def ttl():
+    config = current_app.config
+    options = config["CELERY_CONFIG"]["broker_transport_options"]
+    return config["INFLIGHT_QUEUE_WAIT"] + options["visibility_timeout"]
+
+
+def claim_many(claims):
+    """
+    Claim datasets for tasks, given a mapping of dataset ID to task ID.
+
+    Returns a mapping of dataset ID to the task already holding it, for the
+    datasets that were claimed before.
+    """
+    if not claims:
+        return {}
+
+    expires = ttl()
+    with redis.pipeline() as pipe:
+        for dataset_id, task_id in claims.items():
+            pipe.set(_key(dataset_id), task_id, nx=True, ex=expires)
+        claimed = pipe.execute()
+
+    taken = [dataset_id for dataset_id, ok in zip(claims, claimed) if not ok]
+    if not taken:
+        return {}
+
+    holders = redis.mget([_key(dataset_id) for dataset_id in taken])
+    return {
+        dataset_id: holder.decode("utf-8")
+        for dataset_id, holder in zip(taken, holders)
+        # might have been released in the meantime
+        if holder is not None
+    }
+
+
+def claim(dataset_id, task_id):
+    """Claim a dataset for `task_id`, returns the task holding it if already claimed."""
+    return claim_many({dataset_id: task_id}).get(dataset_id)
+
+
+def release(dataset_id, task_id):
+    _RELEASE(keys=[_key(dataset_id)], args=[task_id])
+
+
+def extend(dataset_id, task_id, expires):
+    """Keep the claim for `expires` seconds more, while the task is running."""
+    _EXTEND(keys=[_key(dataset_id)], args=[task_id, int(expires)])
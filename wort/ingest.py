@@ -0,0 +1,432 @@
+"""
+Bulk ingestion of dataset metadata.
+
+Input is processed in chunks: existing datasets are resolved with a single
+IN query per chunk, new datasets are inserted ignoring conflicts (another
+ingester or a compute request might have added them in the meantime), and
+`computed` is updated for all datasets whose signature is already in
+storage. Each chunk is committed on its own.
+"""
+import csv
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import String, column, values
+from sqlalchemy.dialects import postgresql, sqlite
+
+from wort import cache, inventory, runinfo, stats
+from wort.ext import db
+from wort.models import Dataset, IngestCheckpoint
+
+CHUNK_SIZE = 5000
+
+# Concurrent HTTP requests when resolving genome download paths
+GENOME_WORKERS = 16
+GENOME_BASE_URL = "https://ftp.ncbi.nlm.nih.gov/genomes/all"
+
+
+class IngestReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.start = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def __str__(self):
+        elapsed = self.elapsed
+        rate = self.rows / elapsed if elapsed else 0
+        return (
+            f"{self.rows} rows, {self.inserted} inserted, {self.updated} updated, "
+            f"{self.skipped} skipped in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        )
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_ignore(model, mappings):
+    """
+    INSERT ... ON CONFLICT DO NOTHING, for the dialects supporting it.
+    Returns the mappings actually inserted (not skipped as conflicts).
+    """
+    if not mappings:
+        return []
+
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(table).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table).on_conflict_do_nothing()
+    else:
+        db.session.execute(table.insert(), mappings)
+        return mappings
+
+    inserted = set(db.session.execute(stmt.returning(table.c.id), mappings).scalars())
+    return [m for m in mappings if m["id"] in inserted]
+
+
+def update_computed(public_db, candidates):
+    """
+    Set `computed` for `candidates` (ids of datasets without it) that are
+    already in storage. Returns how many were updated.
+    """
+    updates = []
+    for dataset_id in candidates:
+        computed = inventory.computed_at(public_db, dataset_id)
+        if computed is not None:
+            updates.append({"id": dataset_id, "computed": computed})
+
+    if updates:
+        db.session.bulk_update_mappings(Dataset, updates)
+    return updates
+
+
+def read_runinfo(fp):
+    for row in csv.DictReader(fp, delimiter=","):
+        if row.get("Run") in (None, "", "Run"):
+            # dumb error from entrez-direct, it repeats the header in the middle =/
+            continue
+        yield row
+
+
+def ingest_sra(fp, chunk_size=CHUNK_SIZE, report=None):
+    """Ingest a runinfo CSV, as produced by entrez-direct."""
+    report = report or IngestReport()
+
+    for chunk in chunked(read_runinfo(fp), chunk_size):
+        rows = {row["Run"]: row for row in chunk}
+        report.rows += len(chunk)
+
+        existing = dict(
+            Dataset.query.with_entities(Dataset.id, Dataset.computed)
+            .filter(Dataset.id.in_(list(rows)))
+        )
+
+        new = [
+            {"id": sra_id, "database_id": "SRA",
+             "size_MB": runinfo.size_MB(row), "ipfs": None}
+            for sra_id, row in rows.items() if sra_id not in existing
+        ]
+        inserted = insert_ignore(Dataset, new)
+        stats.record(
+            "SRA", datasets=len(inserted), size_MB=sum(m["size_MB"] or 0 for m in inserted)
+        )
+
+        # Keep the full runinfo rows, so compute requests never need to fetch them
+        runinfo.store(rows)
+
+        updates = update_computed(
+            "sra", [sra_id for sra_id, computed in existing.items() if computed is None]
+        )
+        stats.record("SRA", computed=len(updates))
+
+        db.session.commit()
+        # new datasets might be cached as missing
+        cache.invalidate_datasets("sra", [m["id"] for m in new] + [u["id"] for u in updates])
+
+        report.inserted += len(inserted)
+        report.updated += len(updates)
+
+    return report
+
+
+def http_session(workers=GENOME_WORKERS):
+    """A requests session with enough pooled connections for `workers` threads."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def request_with_retry(session, method, url, retries=4, backoff=0.5, timeout=30):
+    """
+    Send a request, retrying server errors and connection problems with
+    jittered exponential backoff. Returns None if all attempts failed.
+    """
+    import requests
+
+    for attempt in range(retries + 1):
+        try:
+            response = session.request(method, url, timeout=timeout, allow_redirects=True)
+            if response.status_code < 500:
+                return response
+        except requests.RequestException:
+            pass
+        if attempt < retries:
+            time.sleep(random.uniform(0, backoff * 2 ** attempt))
+    return None
+
+
+def assembly_dir(accession):
+    db, acc = accession.split("_")
+    number, version = acc.split(".")
+    number = "/".join([number[pos:pos + 3] for pos in range(0, len(number), 3)])
+    return f"{GENOME_BASE_URL}/{db}/{number}"
+
+
+def build_link(accession, asm_name):
+    return f"{assembly_dir(accession)}/{accession}_{asm_name}"
+
+
+def crawl_link(session, accession):
+    """Find the download path in the directory listing, or None."""
+    url = assembly_dir(accession)
+    response = request_with_retry(session, "GET", url)
+    if response is None or response.status_code != 200:
+        return None
+
+    # try to read the right accession name
+    for line in response.text.split("\n"):
+        if line.startswith(f'<a href="{accession}_'):
+            asm_name = line.split('"')[1][:-1]
+            return f"{url}/{asm_name}/{asm_name}_genomic.fna.gz"
+    return None
+
+
+def genome_name(row):
+    name_parts = [row["assembly_accession"], " ", row["organism_name"]]
+    if row["infraspecific_name"]:
+        name_parts += [" ", row["infraspecific_name"]]
+    name_parts += [", ", row["asm_name"]]
+    return "".join(name_parts)[:128]
+
+
+def genome_path(row):
+    ftp_path = row["ftp_path"]
+    if ftp_path == "na":
+        # check if 'gbrs_paired_asm' is available and
+        # 'paired_asm_comp' is 'identical'
+        if row["paired_asm_comp"] == "identical":
+            ftp_path = build_link(row["gbrs_paired_asm"], row["asm_name"])
+        else:  # need to rebuild path from this accession...
+            ftp_path = build_link(row["assembly_accession"], row["asm_name"])
+
+    # 2021-11-22: ftp_path points to https now
+    filename = ftp_path.split("/")[-1]
+    return f"{ftp_path}/{filename}_genomic.fna.gz"
+
+
+def resolve_genome(session, row):
+    """
+    Find download path and size for an assembly, with a single HEAD request
+    per candidate path. Returns a Dataset mapping, or None if it can't be
+    resolved now (it will be tried again in the next ingest).
+    """
+    accession = row["assembly_accession"]
+    path = genome_path(row)
+
+    response = request_with_retry(session, "HEAD", path)
+    if response is not None and response.status_code == 404:
+        # Error with this path, let's try to crawl instead
+        path = crawl_link(session, accession)
+        if path is None:
+            return None
+        response = request_with_retry(session, "HEAD", path)
+
+    if response is None or response.status_code != 200:
+        return None
+
+    # Assembly summary doesn't include size of dataset,
+    # but the HEAD request has it
+    size = response.headers.get("Content-Length")
+    return {
+        "id": accession,
+        "database_id": "Genomes",
+        "size_MB": int(int(size) / 1000000) if size else None,
+        "ipfs": None,
+        "path": path,
+        "name": genome_name(row),
+    }
+
+
+def read_assembly_summary(fp):
+    fp.readline()  # Skip first line
+    fp.read(1)  # skip initial comment in header
+    yield from csv.DictReader(fp, delimiter="\t")
+
+
+def ingest_genomes(fp, chunk_size=CHUNK_SIZE, workers=GENOME_WORKERS, report=None):
+    """Ingest a GenBank/RefSeq assembly_summary.txt."""
+    report = report or IngestReport()
+
+    with http_session(workers) as session, ThreadPoolExecutor(workers) as executor:
+        for chunk in chunked(read_assembly_summary(fp), chunk_size):
+            rows = {row["assembly_accession"]: row for row in chunk}
+            report.rows += len(chunk)
+
+            existing = dict(
+                Dataset.query.with_entities(Dataset.id, Dataset.computed)
+                .filter(Dataset.id.in_(list(rows)))
+            )
+
+            to_resolve = [row for acc, row in rows.items() if acc not in existing]
+            new = [
+                m for m in executor.map(lambda row: resolve_genome(session, row), to_resolve)
+                if m is not None
+            ]
+            inserted = insert_ignore(Dataset, new)
+            stats.record(
+                "Genomes", datasets=len(inserted),
+                size_MB=sum(m["size_MB"] or 0 for m in inserted),
+            )
+
+            updates = update_computed(
+                "genomes", [acc for acc, computed in existing.items() if computed is None]
+            )
+            stats.record("Genomes", computed=len(updates))
+
+            db.session.commit()
+            # new datasets might be cached as missing
+            cache.invalidate_datasets(
+                "genomes", [m["id"] for m in new] + [u["id"] for u in updates]
+            )
+
+            report.inserted += len(inserted)
+            report.updated += len(updates)
+            report.skipped += len(to_resolve) - len(new)
+
+    return report
+
+
+def parse_ipfs_line(line):
+    """
+    Parse a line from the IPFS hashes files into (public_db, dataset_id, ipfs),
+    or None if it can't be mapped to a dataset.
+    """
+    try:
+        _, ipfs, key = line.strip().split()
+    except ValueError:
+        return None
+
+    if key.startswith("wort-sra"):
+        return "sra", key[14:-4], ipfs
+    elif key.startswith("wort-img"):
+        return "img", key[14:-4], ipfs
+    elif key.startswith("GC"):
+        # These are wort-genomes sigs
+        return "genomes", key[:-4], ipfs
+    elif not key.startswith("wort-"):
+        # These are generated for wort-sra
+        return "sra", key[:-4], ipfs
+    # not sure what to do with this one...
+    return None
+
+
+def read_lines_from(path, offset):
+    """
+    Yield (line, offset after line) for complete lines after `offset`.
+    A partial last line (file still being written) is left for next time.
+    """
+    with open(path, "rb") as fp:
+        fp.seek(0, os.SEEK_END)
+        if fp.tell() < offset:
+            # file was truncated or replaced, start over
+            offset = 0
+        fp.seek(offset)
+        for line in fp:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            yield line.decode("utf-8", "replace"), offset
+
+
+def update_ipfs(updates):
+    """Set `ipfs` for many datasets (a mapping of id to hash) in one statement."""
+    if not updates:
+        return
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        table = Dataset.__table__
+        v = values(column("id", String), column("ipfs", String), name="v").data(
+            list(updates.items())
+        )
+        db.session.execute(
+            table.update()
+            .values(ipfs=v.c.ipfs)
+            .where(table.c.id == v.c.id)
+            .where(table.c.ipfs.is_(None))
+        )
+    else:
+        db.session.bulk_update_mappings(
+            Dataset, [{"id": k, "ipfs": v} for k, v in updates.items()]
+        )
+
+
+def ingest_ipfs(paths, chunk_size=CHUNK_SIZE, report=None):
+    """
+    Ingest IPFS hashes files, continuing from the offset recorded for each
+    file in the previous run. Earlier entries (and files) take precedence,
+    and datasets with `ipfs` already set are not changed.
+    """
+    report = report or IngestReport()
+
+    for path in paths:
+        key = os.path.normpath(path)
+        checkpoint = IngestCheckpoint.query.get(key)
+        if checkpoint is None:
+            checkpoint = IngestCheckpoint(path=key, offset=0)
+
+        for chunk in chunked(read_lines_from(path, checkpoint.offset), chunk_size):
+            report.rows += len(chunk)
+
+            entries = {}
+            for line, _ in chunk:
+                parsed = parse_ipfs_line(line)
+                if parsed is not None and parsed[1] not in entries:
+                    entries[parsed[1]] = parsed
+
+            existing = dict(
+                Dataset.query.with_entities(Dataset.id, Dataset.ipfs)
+                .filter(Dataset.id.in_(list(entries)))
+            )
+
+            updates, new = {}, []
+            for dataset_id, (public_db, _, ipfs) in entries.items():
+                if dataset_id in existing:
+                    if existing[dataset_id] is None:
+                        updates[dataset_id] = ipfs
+                elif public_db == "img":
+                    # we don't have extra metadata for IMG (yet), so add new dataset
+                    new.append({"id": dataset_id, "database_id": "IMG",
+                                "size_MB": None, "ipfs": ipfs})
+                # if it's SRA or genomes, don't add it (run flask ingest first)
+
+            update_ipfs(updates)
+            inserted = insert_ignore(Dataset, new)
+            stats.record("IMG", datasets=len(inserted))
+
+            checkpoint.offset = chunk[-1][1]
+            checkpoint.updated = datetime.utcnow()
+            db.session.add(checkpoint)
+            db.session.commit()
+
+            changed = list(updates) + [m["id"] for m in new]
+            for public_db in {entries[dataset_id][0] for dataset_id in changed}:
+                cache.invalidate_datasets(
+                    public_db, [d for d in changed if entries[d][0] == public_db]
+                )
+
+            report.inserted += len(inserted)
+            report.updated += len(updates)
+
+    return report
@@ -0,0 +1,182 @@
+"""
+Worker-local cache of downloaded inputs (.sra runs, .fna.gz genomes).
+
+Inputs are downloaded to a scratch directory before processing, so a retry
+or a recompute of the same dataset reads from disk instead of downloading
+it again from NCBI. The directory is kept under a byte budget, evicting
+the least recently used files. It can be shared by workers on the same
+host: downloads of the same input are serialised with a lock file, and
+inputs in use hold a shared lock on it so they aren't evicted.
+"""
+import fcntl
+import os
+import subprocess
+from contextlib import contextmanager
+
+from flask import current_app
+
+LOCK_SUFFIX = ".lock"
+PARTIAL_SUFFIX = ".partial"
+
+
+class InputCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, name):
+        return os.path.join(self.directory, name)
+
+    def _lock(self, name, operation):
+        """
+        Open the lock file for `name` and flock it with `operation`. Returns
+        the open file (closing it releases the lock), or None if `LOCK_NB`
+        is given and the lock is held.
+        """
+        lock_path = self.path_for(name) + LOCK_SUFFIX
+        while True:
+            lock = open(lock_path, "a")
+            try:
+                fcntl.flock(lock, operation)
+            except BlockingIOError:
+                lock.close()
+                return None
+            except BaseException:
+                lock.close()
+                raise
+            if _same_file(lock, lock_path):
+                return lock
+            # removed (by `evict`) while waiting for it, lock the new one
+            lock.close()
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith((LOCK_SUFFIX, PARTIAL_SUFFIX)):
+                yield entry
+
+    def usage(self):
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self, needed=0):
+        """
+        Remove least recently used files until `needed` more bytes fit.
+        Files in use (or being downloaded) are skipped.
+        """
+        entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime)
+        used = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if used + needed <= self.max_bytes:
+                break
+            lock = self._lock(entry.name, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if lock is None:
+                continue
+            with lock:
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                    used -= size
+                except FileNotFoundError:
+                    pass
+                os.remove(entry.path + LOCK_SUFFIX)
+
+    def _download(self, name, download, expected_size=None):
+        """Download `name` unless it exists, returns whether it downloaded it."""
+        path = self.path_for(name)
+        with self._lock(name, fcntl.LOCK_EX):
+            if os.path.exists(path):
+                return False
+
+            self.evict(needed=expected_size or 0)
+
+            partial = path + PARTIAL_SUFFIX
+            try:
+                download(partial)
+                os.replace(partial, path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                if not os.path.exists(path):
+                    os.remove(path + LOCK_SUFFIX)
+        return True
+
+    @contextmanager
+    def fetch(self, name, download, expected_size=None):
+        """
+        Context manager for (path, hit) of the input `name`, calling
+        `download(path)` to create it on a miss. The input is kept (not
+        evicted) until exit.
+
+        Gives (None, False) if the input is larger than the cache budget,
+        so the caller can stream it instead.
+        """
+        if expected_size is not None and expected_size > self.max_bytes:
+            yield None, False
+            return
+
+        path = self.path_for(name)
+        downloaded = False
+        while True:
+            lock = self._lock(name, fcntl.LOCK_SH)
+            if os.path.exists(path):
+                break
+            # evicted between the download and the shared lock, get it again
+            lock.close()
+            downloaded = self._download(name, download, expected_size) or downloaded
+
+        with lock:
+            # mark as recently used
+            os.utime(path)
+            if downloaded:
+                self.evict()
+            yield path, not downloaded
+
+
+def _same_file(fp, path):
+    try:
+        return os.path.samestat(os.fstat(fp.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+_caches = {}
+
+
+def get_input_cache(queue=None):
+    """Return the (per process) input cache, or None if not enabled for `queue`."""
+    config = current_app.config
+    directory = config.get("INPUT_CACHE_DIR")
+    if not directory:
+        return None
+
+    queues = config["INPUT_CACHE_QUEUES"]
+    if queues and queue not in queues:
+        return None
+
+    cache = _caches.get(directory)
+    if cache is None:
+        cache = _caches[directory] = InputCache(directory, config["INPUT_CACHE_BYTES"])
+    return cache
+
+
+def prefetch_sra(sra_id, path, timeout=None):
+    """Download the .sra file for a run with `prefetch` (from sra-tools)."""
+    proc = subprocess.run(
+        ["prefetch", "--max-size", "u", "--output-file", path, sra_id],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout,
+    )
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(
+            proc.returncode, proc.args, stderr=proc.stderr
+        )
+
+
+def download_url(url, path, session=None, chunk_size=1024 * 1024):
+    import requests
+
+    get = (session or requests).get
+    with get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(path, "wb") as fp:
+            for chunk in response.iter_content(chunk_size):
+                fp.write(chunk)
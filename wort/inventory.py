@@ -0,0 +1,301 @@
+"""
+Local index of the signatures available in storage.
+
+Instead of one HEAD request per key, the index is built from a paginated
+listing of the bucket (or from S3 Inventory reports) and kept on disk as
+sorted dataset IDs packed in a single blob, with arrays of their offsets
+and last modified times. Workers map the file read-only, so the index is
+shared by all processes on a host (through the page cache) instead of
+being loaded as Python objects in each of them. Lookups are a binary
+search.
+
+Signatures are never removed from the buckets, so refreshing only needs to
+merge new entries into the index. An incremental refresh only lists keys
+after the last indexed one of each prefix: it picks up new accessions, but
+not signatures computed later for older ones, so it doesn't count as a
+full refresh for `is_fresh`.
+"""
+import csv
+import gzip
+import heapq
+import json
+import mmap
+import os
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from flask import current_app
+
+from wort.storage import BUCKETS, get_storage, sig_key
+
+PREFIX = "sigs/"
+SUFFIX = ".sig"
+
+# Sections of the index file are aligned to this (after the JSON header)
+ALIGN = 8
+
+
+def _to_id(key):
+    if key.startswith(PREFIX) and key.endswith(SUFFIX):
+        return key[len(PREFIX):-len(SUFFIX)]
+    return None
+
+
+def _to_epoch(last_modified):
+    if isinstance(last_modified, str):
+        last_modified = datetime.fromisoformat(last_modified.replace("Z", "+00:00"))
+    return int(last_modified.timestamp())
+
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+class PackedIDs:
+    """
+    Sorted IDs (as bytes) stored back to back in `blob` from `base`, the
+    i-th one between `offsets[i]` and `offsets[i + 1]`. A sequence, so it
+    can be searched with `bisect`.
+    """
+
+    def __init__(self, blob=b"", offsets=None, base=0):
+        self.blob = blob
+        self.offsets = offsets if offsets is not None else array("Q", [0])
+        self.base = base
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.blob[self.base + self.offsets[i]:self.base + self.offsets[i + 1]]
+
+
+class Inventory:
+    def __init__(self, path):
+        self.path = path
+        self.ids = PackedIDs()
+        self.modified = array("q")
+        self.refreshed = 0
+        self.manifests = []
+        self._mtime = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lookup(self, dataset_id):
+        """Return when `dataset_id` was computed (as a UTC datetime), or None."""
+        key = dataset_id.encode("utf-8")
+        pos = bisect_left(self.ids, key)
+        if pos < len(self.ids) and self.ids[pos] == key:
+            return datetime.fromtimestamp(self.modified[pos], tz=timezone.utc)
+        return None
+
+    def last_id(self, prefix=""):
+        """The last indexed ID starting with `prefix`, or None."""
+        ids = self.ids
+        if prefix:
+            # first position after every ID starting with the prefix
+            pos = bisect_left(ids, prefix.encode("utf-8") + b"\xff") - 1
+        else:
+            pos = len(ids) - 1
+        if pos >= 0 and ids[pos].startswith(prefix.encode("utf-8")):
+            return ids[pos].decode("utf-8")
+        return None
+
+    def is_fresh(self, max_age):
+        return bool(len(self.ids)) and time.time() - self.refreshed < max_age
+
+    def merge(self, entries):
+        """Merge (dataset_id, epoch) pairs into the index."""
+        new = {}
+        for dataset_id, epoch in entries:
+            new[dataset_id.encode("utf-8")] = epoch
+        if not new:
+            return
+
+        ids = self.ids
+        if len(ids) and min(new) > ids[-1]:
+            # only IDs after the indexed ones (incremental refresh), append
+            blob = bytearray(ids.blob[ids.base:ids.base + ids.offsets[-1]])
+            offsets = array("Q", ids.offsets)
+            modified = array("q", self.modified)
+            items = sorted(new.items())
+        else:
+            blob, offsets, modified = bytearray(), array("Q", [0]), array("q")
+            current = (
+                (ids[i], self.modified[i]) for i in range(len(ids)) if ids[i] not in new
+            )
+            items = heapq.merge(current, sorted(new.items()))
+
+        for key, epoch in items:
+            blob += key
+            offsets.append(len(blob))
+            modified.append(epoch)
+
+        self.ids = PackedIDs(bytes(blob), offsets)
+        self.modified = modified
+
+    def load(self):
+        """Map the index file (read-only), if it exists."""
+        try:
+            fp = open(self.path, "rb")
+        except FileNotFoundError:
+            return self
+
+        with fp:
+            mtime = os.fstat(fp.fileno()).st_mtime
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        end = buf.find(b"\n") + 1
+        header = json.loads(buf[:end])
+        count = header["count"]
+        view = memoryview(buf)
+
+        start = _aligned(end)
+        offsets = view[start:start + 8 * (count + 1)].cast("Q")
+        start += 8 * (count + 1)
+        modified = view[start:start + 8 * count].cast("q")
+        start += 8 * count
+
+        self.ids = PackedIDs(buf, offsets, base=start)
+        self.modified = modified
+        self.refreshed = header["refreshed"]
+        self.manifests = header.get("manifests", [])
+        self._mtime = mtime
+        return self
+
+    def reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return self
+        if mtime != self._mtime:
+            self.load()
+        return self
+
+    def save(self):
+        """
+        Write the index: a JSON header line, then (aligned) the offsets and
+        modified times as native 64 bit integers, and the IDs blob.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        ids = self.ids
+        header = {
+            "refreshed": self.refreshed,
+            "manifests": self.manifests[-30:],
+            "count": len(ids),
+        }
+        header = (json.dumps(header) + "\n").encode("utf-8")
+
+        # write to a temp file and rename, so readers never see partial data
+        # (and workers keep their mapping of the previous file)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(header)
+            fp.write(b"\0" * (_aligned(len(header)) - len(header)))
+            fp.write(memoryview(ids.offsets).cast("B"))
+            fp.write(memoryview(self.modified).cast("B"))
+            fp.write(ids.blob[ids.base:ids.base + ids.offsets[-1]])
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime
+
+    def refresh(self, storage, bucket, prefixes=("",), workers=8, incremental=False):
+        """
+        Update the index from a listing of the bucket.
+
+        `prefixes` splits the key space (e.g. "SRR", "ERR", "DRR") so
+        listings can run concurrently. With `incremental`, only keys after
+        the last indexed one of each prefix are listed.
+        """
+
+        def list_prefix(prefix):
+            start_after = None
+            if incremental:
+                last = self.last_id(prefix)
+                start_after = sig_key(last) if last is not None else None
+
+            entries = []
+            for obj in storage.list(bucket, prefix=PREFIX + prefix, start_after=start_after):
+                dataset_id = _to_id(obj.key)
+                if dataset_id is not None:
+                    entries.append((dataset_id, _to_epoch(obj.modified)))
+            return entries
+
+        started = int(time.time())
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for entries in executor.map(list_prefix, prefixes):
+                self.merge(entries)
+        if not incremental:
+            self.refreshed = started
+
+    def ingest_manifest(self, storage, bucket, manifest_key):
+        """
+        Update the index from an S3 Inventory report (CSV format).
+
+        `manifest_key` points to the report's `manifest.json`, in the bucket
+        where inventory reports are delivered. Already ingested manifests
+        are skipped.
+        """
+        if manifest_key in self.manifests:
+            return False
+
+        with storage.get_stream(bucket, manifest_key) as fp:
+            body = fp.read()
+        manifest = json.loads(body)
+        columns = [c.strip() for c in manifest["fileSchema"].split(",")]
+        key_col = columns.index("Key")
+        modified_col = columns.index("LastModifiedDate")
+
+        for report in manifest["files"]:
+            entries = []
+            with storage.get_stream(bucket, report["key"]) as raw, \
+                 gzip.open(raw, "rt") as fp:
+                for row in csv.reader(fp):
+                    dataset_id = _to_id(row[key_col])
+                    if dataset_id is not None:
+                        entries.append((dataset_id, _to_epoch(row[modified_col])))
+            self.merge(entries)
+
+        # The report is a snapshot of the bucket when it was generated
+        self.refreshed = int(manifest["creationTimestamp"]) // 1000
+        self.manifests.append(manifest_key)
+        return True
+
+
+_inventories = {}
+
+
+def get_inventory(public_db):
+    """Return the (per process) index for `public_db`, or None if not available."""
+    directory = current_app.config.get("INVENTORY_DIR")
+    if not directory:
+        return None
+
+    inventory = _inventories.get(public_db)
+    if inventory is None:
+        path = os.path.join(directory, f"{public_db}.idx")
+        inventory = _inventories[public_db] = Inventory(path).load()
+    return inventory.reload_if_changed()
+
+
+def computed_at(public_db, dataset_id):
+    """
+    When was the signature for `dataset_id` stored (or None if it wasn't).
+
+    Uses the inventory index if it is fresh, and falls back to asking the
+    storage (a HEAD request, for S3) if there is no index for this process.
+    """
+    inventory = get_inventory(public_db)
+    if inventory is not None and inventory.is_fresh(current_app.config["INVENTORY_MAX_AGE"]):
+        return inventory.lookup(dataset_id)
+
+    info = get_storage().stat(BUCKETS[public_db], sig_key(dataset_id))
+    return info.modified if info is not None else None
@@ -0,0 +1,278 @@
+"""
+sourmash manifests for wort signatures.
+
+A manifest has one row per sketch, describing it without having to load
+the signature. Rows are built from the signature JSON directly, so there is
+no need to import sourmash in the web app.
+
+`CatalogManifest` keeps a manifest for a whole public database in a SQLite
+file using the sourmash `SqliteManifest` schema, updated incrementally with
+the datasets written (`Dataset.updated`) since the previous export.
+"""
+import csv
+import gzip
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from wort.storage import sig_key
+
+MANIFEST_VERSION = "1.0"
+
+COLUMNS = (
+    "internal_location",
+    "md5",
+    "md5short",
+    "ksize",
+    "moltype",
+    "num",
+    "scaled",
+    "n_hashes",
+    "with_abundance",
+    "name",
+    "filename",
+)
+
+MAX_HASH = 2 ** 64 - 1
+
+DATABASES = {"sra": "SRA", "genomes": "Genomes", "img": "IMG"}
+
+# Only export datasets written at least this long ago, so transactions
+# still in progress when the export runs are not skipped
+SETTLE_TIME = timedelta(minutes=10)
+
+
+def _scaled(max_hash):
+    if not max_hash:
+        return 0
+    return int(round(MAX_HASH / max_hash, 0))
+
+
+def _moltype(sketch):
+    molecule = sketch.get("molecule", "DNA")
+    return "DNA" if molecule.upper() == "DNA" else molecule.lower()
+
+
+def load_json(data):
+    """Signature JSON from raw bytes (gzipped or not)."""
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    return json.loads(data)
+
+
+def rows_from_json(sigs, internal_location):
+    """Manifest rows for a parsed signature file (a list of signatures)."""
+    if isinstance(sigs, dict):
+        sigs = [sigs]
+
+    rows = []
+    for sig in sigs:
+        for sketch in sig.get("signatures", []):
+            md5 = sketch["md5sum"]
+            rows.append({
+                "internal_location": internal_location,
+                "md5": md5,
+                "md5short": md5[:8],
+                "ksize": sketch["ksize"],
+                "moltype": _moltype(sketch),
+                "num": sketch.get("num", 0),
+                "scaled": _scaled(sketch.get("max_hash", 0)),
+                "n_hashes": len(sketch.get("mins", [])),
+                "with_abundance": int(bool(sketch.get("abundances"))),
+                "name": sig.get("name", ""),
+                "filename": sig.get("filename", ""),
+            })
+    return rows
+
+
+def write_header(fp):
+    fp.write(f"# SOURMASH-MANIFEST-VERSION: {MANIFEST_VERSION}\n")
+    writer = csv.DictWriter(fp, fieldnames=COLUMNS)
+    writer.writeheader()
+    return writer
+
+
+def write_csv(fp, rows):
+    writer = write_header(fp)
+    writer.writerows(rows)
+
+
+def internal_location(dataset_id):
+    """Location of a signature, relative to the bucket root."""
+    return sig_key(dataset_id)
+
+
+class CatalogManifest:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self._create_tables()
+
+    def _create_tables(self):
+        c = self.conn.cursor()
+        c.execute("CREATE TABLE IF NOT EXISTS sourmash_internal (key TEXT UNIQUE, value TEXT)")
+        c.execute(
+            "INSERT OR IGNORE INTO sourmash_internal (key, value) VALUES ('SqliteManifest', '1.0')"
+        )
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS sourmash_sketches
+              (id INTEGER PRIMARY KEY,
+               name TEXT,
+               num INTEGER NOT NULL,
+               scaled INTEGER NOT NULL,
+               ksize INTEGER NOT NULL,
+               filename TEXT,
+               moltype TEXT NOT NULL,
+               with_abundance BOOLEAN NOT NULL,
+               md5sum TEXT NOT NULL,
+               seed INTEGER NOT NULL,
+               n_hashes INTEGER NOT NULL,
+               internal_location TEXT,
+            UNIQUE(internal_location, md5sum)
+            )
+        """)
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS wort_location_idx ON sourmash_sketches (internal_location)"
+        )
+        c.execute("CREATE TABLE IF NOT EXISTS wort_export (key TEXT UNIQUE, value TEXT)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM sourmash_sketches").fetchone()[0]
+
+    def _get(self, key):
+        row = self.conn.execute("SELECT value FROM wort_export WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO wort_export (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    @property
+    def watermark(self):
+        """`updated` of the most recent dataset in the manifest."""
+        value = self._get("updated")
+        return datetime.fromisoformat(value) if value else None
+
+    def replace(self, dataset_id, rows):
+        """Replace the rows for a dataset (it might have been recomputed)."""
+        location = internal_location(dataset_id)
+        self.conn.execute(
+            "DELETE FROM sourmash_sketches WHERE internal_location = ?", (location,)
+        )
+        self.conn.executemany(
+            """
+            INSERT OR IGNORE INTO sourmash_sketches
+              (name, num, scaled, ksize, filename, md5sum, moltype,
+               seed, n_hashes, with_abundance, internal_location)
+            VALUES (:name, :num, :scaled, :ksize, :filename, :md5,
+                    :moltype, 42, :n_hashes, :with_abundance,
+                    :internal_location)
+            """,
+            rows,
+        )
+
+    def commit(self, watermark):
+        self._set("updated", watermark.isoformat())
+        self.conn.commit()
+
+    def rows(self):
+        for row in self.conn.execute(
+            """
+            SELECT internal_location, md5sum, ksize, moltype, num, scaled,
+                   n_hashes, with_abundance, name, filename
+            FROM sourmash_sketches ORDER BY id
+            """
+        ):
+            (location, md5, ksize, moltype, num, scaled,
+             n_hashes, with_abundance, name, filename) = row
+            yield {
+                "internal_location": location,
+                "md5": md5,
+                "md5short": md5[:8],
+                "ksize": ksize,
+                "moltype": moltype,
+                "num": num,
+                "scaled": scaled,
+                "n_hashes": n_hashes,
+                "with_abundance": int(with_abundance),
+                "name": name,
+                "filename": filename,
+            }
+
+    def write_csv(self, fp):
+        write_csv(fp, self.rows())
+
+    def snapshot(self, path):
+        """Consistent copy of the SQLite manifest, without the export state."""
+        if os.path.exists(path):
+            os.remove(path)
+        target = sqlite3.connect(path)
+        try:
+            self.conn.backup(target)
+            target.execute("DROP TABLE wort_export")
+            target.execute("DROP INDEX wort_location_idx")
+            target.commit()
+            target.execute("VACUUM")
+        finally:
+            target.close()
+
+
+def update_catalog(catalog, public_db, fetch, chunk_size=1000, workers=16):
+    """
+    Add datasets computed or changed since the catalog watermark. `fetch`
+    returns the raw signature for a dataset ID (or None if it is not in
+    storage).
+
+    `computed` can't be used for this: it is backfilled from the storage
+    modification time, which is older than the watermark.
+
+    Returns how many datasets were added.
+    """
+    from wort.models import Dataset
+
+    query = Dataset.query.with_entities(Dataset.id, Dataset.updated).filter(
+        Dataset.database_id == DATABASES[public_db],
+        Dataset.computed.isnot(None),
+        Dataset.updated < datetime.utcnow() - SETTLE_TIME,
+    )
+    watermark = catalog.watermark
+    if watermark is not None:
+        # datasets updated at the watermark might not be all in yet,
+        # and replacing rows is idempotent
+        query = query.filter(Dataset.updated >= watermark)
+    query = query.order_by(Dataset.updated, Dataset.id)
+
+    added = 0
+    chunk = []
+    with ThreadPoolExecutor(workers) as executor:
+        def flush():
+            nonlocal added
+            ids = [dataset_id for dataset_id, _ in chunk]
+            for dataset_id, data in zip(ids, executor.map(fetch, ids)):
+                if data is None:
+                    continue
+                rows = rows_from_json(load_json(data), internal_location(dataset_id))
+                catalog.replace(dataset_id, rows)
+                added += 1
+            catalog.commit(chunk[-1][1])
+            chunk.clear()
+
+        for dataset_id, updated in query.yield_per(chunk_size):
+            chunk.append((dataset_id, updated))
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+
+    return added
+
+
+def snapshot_version():
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
@@ -0,0 +1,131 @@
+"""
+Per-stage metrics for compute tasks.
+
+Each compute task records wall time, bytes and reads/bases for its stages
+(prefetch, download, sketch, save, gzip, upload), and hits/misses of the
+worker input cache. They are saved with the task
+(see `wort.routing.track_resources`) and exported in the Prometheus text
+format by the `/metrics` route.
+"""
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+STAGES = ("prefetch", "download", "sketch", "save", "gzip", "upload", "input_cache")
+COUNTERS = ("seconds", "bytes_in", "bytes_out", "reads", "bases", "hits", "misses")
+
+# Buckets used to label metrics by dataset size
+SIZE_BUCKETS = ((300, "le300MB"), (1600, "le1600MB"), (10000, "le10GB"))
+
+
+class TaskMetrics:
+    def __init__(self):
+        self.stages = defaultdict(lambda: defaultdict(float))
+
+    def add(self, stage, **counters):
+        for name, value in counters.items():
+            if value is not None:
+                self.stages[stage][name] += value
+
+    @contextmanager
+    def stage(self, stage, **counters):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(stage, seconds=time.perf_counter() - start, **counters)
+
+    def to_json(self):
+        return json.dumps({k: dict(v) for k, v in self.stages.items()})
+
+
+class TimedReader:
+    """
+    Wrap a file-like object, counting bytes read and time spent waiting on it.
+
+    When reading from a pipe this is the time spent on the producer side
+    (e.g. fastq-dump downloading and extracting reads).
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        data = method(*args)
+        self.seconds += time.perf_counter() - start
+        self.bytes += len(data)
+        return data
+
+    def read(self, size=-1):
+        return self._timed(self.fp.read, size)
+
+    def read1(self, size=-1):
+        return self._timed(self.fp.read1, size)
+
+    def readinto(self, b):
+        start = time.perf_counter()
+        n = self.fp.readinto(b)
+        self.seconds += time.perf_counter() - start
+        self.bytes += n or 0
+        return n
+
+    def readable(self):
+        return True
+
+    @property
+    def closed(self):
+        return self.fp.closed
+
+
+def size_bucket(size_MB):
+    for limit, label in SIZE_BUCKETS:
+        if size_MB is not None and size_MB <= limit:
+            return label
+    return "larger" if size_MB is not None else "unknown"
+
+
+def render_prometheus(hours=24):
+    """Aggregate stage metrics of recently finished tasks."""
+    from wort.models import Task
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    tasks = (
+        Task.query.with_entities(Task.queue, Task.size_MB, Task.complete, Task.stages)
+        .filter(Task.finished >= since)
+        .all()
+    )
+
+    totals = defaultdict(float)
+    runs = defaultdict(int)
+    for queue, size_MB, complete, stages in tasks:
+        labels = (queue or "unknown", size_bucket(size_MB))
+        runs[labels + ("success" if complete else "failure",)] += 1
+        for stage, counters in json.loads(stages or "{}").items():
+            for name, value in counters.items():
+                totals[(name, stage) + labels] += value
+
+    lines = [
+        "# HELP wort_tasks_total Compute tasks finished in the window.",
+        "# TYPE wort_tasks_total gauge",
+    ]
+    for (queue, bucket, status), n in sorted(runs.items()):
+        lines.append(
+            f'wort_tasks_total{{queue="{queue}",size="{bucket}",status="{status}"}} {n}'
+        )
+
+    for name in COUNTERS:
+        metric = f"wort_task_stage_{name}"
+        lines.append(f"# HELP {metric} Sum of {name} per compute stage in the window.")
+        lines.append(f"# TYPE {metric} gauge")
+        for (counter, stage, queue, bucket), value in sorted(totals.items()):
+            if counter == name:
+                lines.append(
+                    f'{metric}{{stage="{stage}",queue="{queue}",size="{bucket}"}} {value:g}'
+                )
+
+    return "\n".join(lines) + "\n"
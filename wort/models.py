@@ -58,6 +58,15 @@ class Task(db.Model):
     name = db.Column(db.String(128), index=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     complete = db.Column(db.Boolean, default=False)
+    dataset_id = db.Column(db.String(20), index=True, nullable=True)
+    queue = db.Column(db.String(32), nullable=True)
+    size_MB = db.Column(db.Integer, nullable=True)
+    bases = db.Column(db.BigInteger, nullable=True)
+    spots = db.Column(db.BigInteger, nullable=True)
+    runtime = db.Column(db.Float, nullable=True)
+    peak_memory_MB = db.Column(db.Integer, nullable=True)
+    stages = db.Column(db.Text, nullable=True)
+    finished = db.Column(db.DateTime, index=True, nullable=True)
 
 
 class Database(db.Model):
@@ -74,3 +83,30 @@ class Dataset(db.Model):
     path = db.Column(db.String(340), nullable=True)
     name = db.Column(db.String(160), nullable=True)
     computed = db.Column(db.DateTime, nullable=True)
+    # Set on every write, for incremental exports (see wort.manifest)
+    updated = db.Column(db.DateTime, nullable=True, index=True,
+                        default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RunInfo(db.Model):
+    id = db.Column(db.String(20), primary_key=True, index=True, unique=True)
+    data = db.Column(db.Text, nullable=False)
+    fetched = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class DatabaseStats(db.Model):
+    database_id = db.Column(db.String(20), db.ForeignKey("database.id"), primary_key=True)
+    n_datasets = db.Column(db.BigInteger, nullable=False, default=0)
+    n_computed = db.Column(db.BigInteger, nullable=False, default=0)
+    size_MB = db.Column(db.BigInteger, nullable=False, default=0)
+    updated = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def n_pending(self):
+        return self.n_datasets - self.n_computed
+
+
+class IngestCheckpoint(db.Model):
+    path = db.Column(db.String(340), primary_key=True)
+    offset = db.Column(db.BigInteger, nullable=False, default=0)
+    updated = db.Column(db.DateTime, nullable=True)
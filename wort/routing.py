@@ -0,0 +1,245 @@
+"""
+Route compute tasks to queues based on the resources they are predicted
+to use.
+
+Every finished compute task records its runtime and peak memory in the
+`task` table. A linear model of runtime and memory over size_MB, bases and
+spots is fitted from these records, and a dataset goes to the smallest
+queue whose limits (QUEUE_LIMITS) fit the prediction. Until there are
+enough records, the fixed size_MB thresholds are used.
+
+Workers only listen to their own queue. Workers on large machines can
+take medium tasks when there is no large work with the
+`drain.DrainWhenIdle` bootstep: after WORKER_IDLE_SECONDS without tasks
+they also consume from WORKER_DRAIN_QUEUES, until the next task arrives.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from wort import runinfo
+from wort.ext import db
+from wort.metrics import TaskMetrics
+from wort.models import Task
+
+QUEUES = ("compute_small", "compute_medium", "compute_large")
+
+# Minimum number of finished tasks before trusting the model
+MIN_SAMPLES = 50
+# How many recent tasks are used for fitting
+MAX_SAMPLES = 5000
+# Predictions are multiplied by this, to leave some headroom
+SAFETY_MARGIN = 1.25
+
+
+def threshold_queue(size_MB):
+    if size_MB is None or size_MB <= 300:
+        return "compute_small"
+    elif size_MB > 300 and size_MB < 1600:
+        return "compute_medium"
+    else:
+        return "compute_large"
+
+
+def features(size_MB, bases=None, spots=None):
+    # bases and spots are not available for every dataset (e.g. genomes)
+    return [
+        1.0,
+        float(size_MB or 0),
+        float(bases or 0) / 1e6,
+        float(spots or 0) / 1e6,
+    ]
+
+
+def _solve(a, b):
+    """Solve a x = b (a is small and square) by Gaussian elimination."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        m[col], m[pivot] = m[pivot], m[col]
+        if abs(m[col][col]) < 1e-12:
+            continue
+        for r in range(n):
+            if r != col:
+                factor = m[r][col] / m[col][col]
+                m[r] = [x - factor * y for x, y in zip(m[r], m[col])]
+    return [m[i][n] / m[i][i] if abs(m[i][i]) >= 1e-12 else 0.0 for i in range(n)]
+
+
+def fit(xs, ys, ridge=1e-6):
+    """Least squares (with a tiny ridge term, for collinear features)."""
+    k = len(xs[0])
+    xtx = [[sum(x[i] * x[j] for x in xs) for j in range(k)] for i in range(k)]
+    for i in range(k):
+        xtx[i][i] += ridge
+    xty = [sum(x[i] * y for x, y in zip(xs, ys)) for i in range(k)]
+    return _solve(xtx, xty)
+
+
+def predict(weights, x):
+    return sum(w * v for w, v in zip(weights, x))
+
+
+def fit_model():
+    """Fit runtime and memory models from recent finished tasks, or None."""
+    runs = (
+        Task.query.filter(
+            Task.complete.is_(True),
+            Task.runtime.isnot(None),
+            Task.peak_memory_MB.isnot(None),
+        )
+        .order_by(Task.finished.desc())
+        .limit(MAX_SAMPLES)
+        .all()
+    )
+    if len(runs) < MIN_SAMPLES:
+        return None
+
+    xs = [features(r.size_MB, r.bases, r.spots) for r in runs]
+    return {
+        "runtime": fit(xs, [r.runtime for r in runs]),
+        "memory_MB": fit(xs, [r.peak_memory_MB for r in runs]),
+        "samples": len(runs),
+    }
+
+
+def get_model():
+    model = current_app.cache.get("routing/model")
+    if model is None:
+        model = fit_model() or {}
+        current_app.cache.set("routing/model", model, timeout=3600)
+    return model or None
+
+
+def select_queues(datasets):
+    """Pick a queue for each dataset, returns a mapping of dataset ID to queue."""
+    model = get_model()
+    if model is None:
+        return {d.id: threshold_queue(d.size_MB) for d in datasets}
+
+    limits = current_app.config["QUEUE_LIMITS"]
+    rows = runinfo.lookup([d.id for d in datasets if d.database_id == "SRA"])
+
+    queues = {}
+    for dataset in datasets:
+        row = rows.get(dataset.id, {})
+        x = features(dataset.size_MB, row.get("bases") or None, row.get("spots") or None)
+        runtime = predict(model["runtime"], x) * SAFETY_MARGIN
+        memory = predict(model["memory_MB"], x) * SAFETY_MARGIN
+
+        queue = QUEUES[-1]
+        for name in QUEUES[:-1]:
+            limit = limits[name]
+            if memory <= limit["memory_MB"] and runtime <= limit["runtime"]:
+                queue = name
+                break
+        queues[dataset.id] = queue
+    return queues
+
+
+def select_queue(dataset):
+    return select_queues([dataset])[dataset.id]
+
+
+def _process_tree_rss(pid):
+    """Resident memory (in kB) of a process and all its descendants."""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status") as fp:
+            for line in fp:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+                    break
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as fp:
+                for child in fp.read().split():
+                    total += _process_tree_rss(int(child))
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        pass
+    return total
+
+
+class MemoryMonitor:
+    """Sample the memory of this process and its children while running."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.peak_kB = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        pid = os.getpid()
+        while True:
+            self.peak_kB = max(self.peak_kB, _process_tree_rss(pid))
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def peak_MB(self):
+        return self.peak_kB // 1024 if self.peak_kB else None
+
+
+class track_resources:
+    """
+    Record runtime, peak memory and per-stage metrics of a compute task
+    in the `task` table.
+
+    Only successful runs are used for fitting the model.
+    """
+
+    def __init__(self, request, dataset_id, name):
+        self.request = request
+        self.dataset_id = dataset_id
+        self.name = name
+        self.monitor = MemoryMonitor()
+        self.metrics = TaskMetrics()
+        self.skipped = False
+
+    def skip(self):
+        """Don't record this run (e.g. nothing was computed)."""
+        self.skipped = True
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        self.monitor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.monitor.__exit__(exc_type, exc, tb)
+        runtime = time.monotonic() - self.start
+        if self.skipped:
+            return False
+
+        from wort.models import Dataset
+
+        dataset = Dataset.query.get(self.dataset_id)
+        row = runinfo.lookup([self.dataset_id]).get(self.dataset_id, {})
+
+        task = Task.query.get(self.request.id) or Task(id=self.request.id)
+        task.name = self.name
+        task.dataset_id = self.dataset_id
+        task.queue = (self.request.delivery_info or {}).get("routing_key")
+        task.size_MB = dataset.size_MB if dataset is not None else None
+        task.bases = row.get("bases") or None
+        task.spots = row.get("spots") or None
+        task.runtime = runtime
+        task.peak_memory_MB = self.monitor.peak_MB
+        task.stages = self.metrics.to_json()
+        task.complete = exc_type is None
+        task.finished = datetime.utcnow()
+        db.session.add(task)
+        db.session.commit()
+        return False
@@ -0,0 +1,96 @@
+"""
+Resolve SRA runinfo metadata.
+
+Rows fetched from SRA are kept in the `run_info` table, so an accession is
+only ever requested once. Accessions are fetched in chunks, each chunk being
+a single efetch-style query.
+"""
+import csv
+import json
+
+import requests
+from flask import current_app
+
+from wort.ext import db
+from wort.models import RunInfo
+
+# How many accessions go into a single runinfo query
+# (the term is part of the URL, so keep it bounded)
+CHUNK_SIZE = 200
+
+
+def parse(rawdata):
+    """Parse runinfo CSV, returning rows keyed by run accession."""
+    rows = {}
+    for row in csv.DictReader(rawdata.splitlines(), delimiter=","):
+        if row.get("Run") in (None, "", "Run"):
+            # entrez repeats the header in the middle of the output
+            continue
+        rows[row["Run"]] = row
+    return rows
+
+
+def size_MB(row):
+    """Size of a run from its runinfo row (CSV values are strings)."""
+    try:
+        return int(float(row["size_MB"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def fetch(sra_ids, url=None, session=None, timeout=60):
+    """Query SRA for many accessions, one request per chunk."""
+    url = url or current_app.config["RUNINFO_URL"]
+    get = (session or requests).get
+
+    rows = {}
+    sra_ids = list(sra_ids)
+    for start in range(0, len(sra_ids), CHUNK_SIZE):
+        term = " OR ".join(sra_ids[start:start + CHUNK_SIZE])
+        response = get(url, params={"term": term}, timeout=timeout)
+        response.raise_for_status()
+        rows.update(parse(response.content.decode("utf-8")))
+    return rows
+
+
+def lookup(sra_ids):
+    """Return stored runinfo rows for the accessions we already know."""
+    sra_ids = list(sra_ids)
+    if not sra_ids:
+        return {}
+    found = RunInfo.query.filter(RunInfo.id.in_(sra_ids)).all()
+    return {r.id: json.loads(r.data) for r in found}
+
+
+def store(rows):
+    """Save runinfo rows (a mapping of accession to row), replacing old ones."""
+    if not rows:
+        return
+
+    known = {
+        r.id for r in
+        RunInfo.query.with_entities(RunInfo.id).filter(RunInfo.id.in_(list(rows)))
+    }
+    new = [{"id": k, "data": json.dumps(v)} for k, v in rows.items() if k not in known]
+    updated = [{"id": k, "data": json.dumps(v)} for k, v in rows.items() if k in known]
+
+    if new:
+        db.session.bulk_insert_mappings(RunInfo, new)
+    if updated:
+        db.session.bulk_update_mappings(RunInfo, updated)
+
+
+def resolve(sra_ids, url=None, session=None):
+    """
+    Return runinfo rows for all accessions, fetching only the missing ones.
+
+    Accessions unknown to SRA are not present in the result.
+    """
+    rows = lookup(sra_ids)
+    missing = [sra_id for sra_id in sra_ids if sra_id not in rows]
+    if missing:
+        fetched = fetch(missing, url=url, session=session)
+        store(fetched)
+        db.session.commit()
+        rows.update(fetched)
+    return rows
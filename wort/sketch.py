@@ -0,0 +1,273 @@
+"""
+Build signatures in-process with the sourmash library.
+
+Equivalent to
+
+    sourmash compute -k 21,31,51 --scaled 1000 --track-abundance --name NAME
+
+but reading FASTA/FASTQ from a byte stream in large buffered batches, with
+all k-mer sizes filled in a single pass over the reads.
+"""
+import io
+
+KSIZES = (21, 31, 51)
+SCALED = 1000
+
+# Bytes requested from the underlying stream at a time
+BUFFER_SIZE = 4 * 1024 * 1024
+# Sequences handed to sourmash per batch
+BATCH_SIZE = 10000
+
+
+class SketchError(Exception):
+    pass
+
+
+def read_batches(stream, batch_size=BATCH_SIZE, buffer_size=BUFFER_SIZE):
+    """
+    Parse FASTA or FASTQ from a binary stream, yielding lists of sequences.
+
+    FASTA sequences can span multiple lines, FASTQ records are expected to be
+    four lines each (as written by fastq-dump).
+    """
+    if not isinstance(stream, io.BufferedIOBase):
+        stream = io.BufferedReader(stream, buffer_size=buffer_size)
+
+    lines = iter(stream)
+    first = next(lines, b"")
+    while first and not first.strip():
+        first = next(lines, b"")
+    if not first:
+        return
+
+    batch = []
+    if first.startswith(b">"):
+        parts = []
+        for line in lines:
+            if line.startswith(b">"):
+                batch.append(b"".join(parts).decode("ascii"))
+                parts = []
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            else:
+                parts.append(line.rstrip())
+        batch.append(b"".join(parts).decode("ascii"))
+    elif first.startswith(b"@"):
+        for n, line in enumerate(lines):
+            # first line (header) was already consumed, so the sequence
+            # is at the start of every 4 lines
+            if n % 4 == 0:
+                batch.append(line.rstrip().decode("ascii"))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    else:
+        raise SketchError(f"Input is not FASTA or FASTQ: {first[:50]!r}")
+
+    if batch:
+        yield batch
+
+
+class Sketcher:
+    def __init__(self, ksizes=KSIZES, scaled=SCALED, track_abundance=True):
+        from sourmash import SourmashSignature
+        from sourmash.command_compute import ComputeParameters
+
+        params = ComputeParameters(
+            ksizes=list(ksizes),
+            num_hashes=0,
+            scaled=scaled,
+            track_abundance=track_abundance,
+        )
+        # one signature holding a sketch for each ksize,
+        # so each sequence is only passed once to sourmash
+        self.signature = SourmashSignature.from_params(params)
+        self.n_reads = 0
+        self.n_bases = 0
+
+    def add_batch(self, sequences):
+        add = self.signature.add_sequence
+        for seq in sequences:
+            # like `sourmash compute` (without --check-sequence),
+            # skip k-mers with invalid characters
+            add(seq, True)
+            self.n_bases += len(seq)
+        self.n_reads += len(sequences)
+
+    def consume(self, stream, **kwargs):
+        for batch in read_batches(stream, **kwargs):
+            self.add_batch(batch)
+        return self
+
+    def to_json(self, name=None, filename=""):
+        import json
+
+        import sourmash
+
+        if name is not None:
+            self.signature._name = name
+        self.signature.filename = filename
+        return json.loads(sourmash.save_signatures([self.signature]))
+
+    def sketches(self):
+        return [
+            {k: v for k, v in sketch.items() if k in ("mins", "abundances", "md5sum")}
+            for sketch in self.to_json()[0]["signatures"]
+        ]
+
+    def save(self, fp, name, filename=""):
+        import sourmash
+
+        self.signature._name = name
+        self.signature.filename = filename
+        sourmash.save_signatures([self.signature], fp)
+
+
+def sketch_stream(stream, name, output, processes=1, **kwargs):
+    """
+    Sketch all reads from `stream` into a single signature saved to `output`.
+
+    Returns the sketcher, for read and base counts.
+    """
+    sketcher = make_sketcher(processes, **kwargs).consume(stream)
+    if sketcher.n_reads == 0:
+        raise SketchError("No sequences found in input")
+
+    sketcher.save(output, name)
+    return sketcher
+
+
+def read_chunks(stream, chunk_size=32 * 1024 * 1024):
+    """
+    Split a FASTA/FASTQ byte stream into chunks holding only whole records.
+    """
+    carry = b""
+    fmt = None
+    while True:
+        block = stream.read(chunk_size)
+        data = carry + block
+        if not block:
+            if data.strip():
+                yield data
+            return
+
+        if fmt is None:
+            fmt = data.lstrip()[:1]
+            if fmt not in (b">", b"@"):
+                raise SketchError(f"Input is not FASTA or FASTQ: {data[:50]!r}")
+
+        if fmt == b">":
+            # cut right before the last header in this block
+            cut = data.rfind(b"\n>") + 1
+        else:
+            # cut after the last complete 4-line record
+            n_lines = data.count(b"\n")
+            cut = len(data)
+            for _ in range(n_lines % 4 + 1):
+                cut = data.rfind(b"\n", 0, cut)
+            cut += 1
+
+        if cut <= 0:
+            carry = data
+            continue
+
+        yield data[:cut]
+        carry = data[cut:]
+
+
+def _sketch_chunk(chunk, ksizes, scaled, track_abundance):
+    sketcher = Sketcher(ksizes, scaled, track_abundance)
+    sketcher.consume(io.BytesIO(chunk))
+    return sketcher.n_reads, sketcher.n_bases, sketcher.sketches()
+
+
+class ShardedSketcher:
+    """
+    Sketch a stream using a pool of processes.
+
+    The stream is split into chunks of whole records, each chunk is sketched
+    in a separate process and the partial sketches are merged (union of
+    hashes, summing abundances), so the result is the same as `Sketcher`.
+    """
+
+    def __init__(self, processes, ksizes=KSIZES, scaled=SCALED, track_abundance=True,
+                 chunk_size=32 * 1024 * 1024):
+        from sourmash import MinHash
+
+        self.processes = processes
+        self.params = (list(ksizes), scaled, track_abundance)
+        self.chunk_size = chunk_size
+        self.minhashes = [
+            MinHash(n=0, ksize=k, scaled=scaled, track_abundance=track_abundance)
+            for k in ksizes
+        ]
+        self.n_reads = 0
+        self.n_bases = 0
+
+    def merge(self, n_reads, n_bases, sketches):
+        self.n_reads += n_reads
+        self.n_bases += n_bases
+        for mh, sketch in zip(self.minhashes, sketches):
+            partial = mh.copy_and_clear()
+            if "abundances" in sketch:
+                partial.set_abundances(dict(zip(sketch["mins"], sketch["abundances"])))
+            else:
+                partial.add_many(sketch["mins"])
+            mh.merge(partial)
+
+    def consume(self, stream):
+        import multiprocessing
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        # Bound the chunks in flight, otherwise reading the input
+        # faster than it can be sketched would buffer it all in memory
+        max_pending = 2 * self.processes
+        pending = set()
+        # Forking after sourmash was used in this process can deadlock
+        # the children, so start them fresh
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=context) as executor:
+            for chunk in read_chunks(stream, self.chunk_size):
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.merge(*future.result())
+                pending.add(executor.submit(_sketch_chunk, chunk, *self.params))
+
+            for future in pending:
+                self.merge(*future.result())
+        return self
+
+    def sketches(self):
+        from sourmash import SourmashSignature
+
+        sketches = []
+        for mh in self.minhashes:
+            hashes = mh.hashes
+            mins = sorted(hashes)
+            sketch = {"mins": mins, "md5sum": SourmashSignature(mh).md5sum()}
+            if mh.track_abundance:
+                sketch["abundances"] = [hashes[h] for h in mins]
+            sketches.append(sketch)
+        return sketches
+
+    def save(self, fp, name, filename=""):
+        import json
+
+        # Same layout as the serial sketcher, with the merged sketches
+        template = Sketcher(*self.params)
+        sig = template.to_json(name, filename)
+        for sketch, merged in zip(sig[0]["signatures"], self.sketches()):
+            sketch.update(merged)
+        json.dump(sig, fp, separators=(",", ":"))
+
+
+def make_sketcher(processes=1, **kwargs):
+    """A `Sketcher`, or a `ShardedSketcher` when more than one process is available."""
+    import multiprocessing
+
+    # daemonic processes (e.g. prefork pool workers) can't start a pool
+    if processes > 1 and not multiprocessing.current_process().daemon:
+        return ShardedSketcher(processes, **kwargs)
+    return Sketcher(**kwargs)
@@ -0,0 +1,108 @@
+"""
+Per-database catalog counters (datasets, computed, pending, size).
+
+Counters are updated in the same transaction as the change they count
+(`record`), and periodically recomputed from the `dataset` table
+(`resync`, run by `flask stats resync`) to correct any drift.
+"""
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from wort.ext import db
+from wort.models import Dataset, DatabaseStats
+
+
+def record(database_id, datasets=0, computed=0, size_MB=0):
+    """
+    Adjust the counters for `database_id`. Doesn't commit, so it is part
+    of the caller's transaction.
+    """
+    if not (datasets or computed or size_MB):
+        return
+
+    table = DatabaseStats.__table__
+    result = db.session.execute(
+        table.update()
+        .where(table.c.database_id == database_id)
+        .values(
+            n_datasets=table.c.n_datasets + datasets,
+            n_computed=table.c.n_computed + computed,
+            size_MB=table.c.size_MB + int(size_MB or 0),
+            updated=datetime.utcnow(),
+        )
+    )
+    if result.rowcount == 0:
+        # a database without counters yet (the migration seeds the known
+        # ones). Upsert, concurrent first writers would collide otherwise
+        values = dict(
+            database_id=database_id,
+            n_datasets=datasets,
+            n_computed=computed,
+            size_MB=int(size_MB or 0),
+            updated=datetime.utcnow(),
+        )
+        dialect = db.session.get_bind().dialect.name
+        if dialect == "postgresql":
+            insert = postgresql.insert(table)
+        elif dialect == "sqlite":
+            insert = sqlite.insert(table)
+        else:
+            db.session.execute(table.insert().values(**values))
+            return
+        db.session.execute(
+            insert.values(**values).on_conflict_do_update(
+                index_elements=[table.c.database_id],
+                set_=dict(
+                    n_datasets=table.c.n_datasets + insert.excluded.n_datasets,
+                    n_computed=table.c.n_computed + insert.excluded.n_computed,
+                    size_MB=table.c.size_MB + insert.excluded.size_MB,
+                    updated=insert.excluded.updated,
+                ),
+            )
+        )
+
+
+def resync():
+    """Recompute all counters from the dataset table."""
+    rows = (
+        Dataset.query.with_entities(
+            Dataset.database_id,
+            func.count(Dataset.id),
+            func.count(Dataset.computed),
+            func.coalesce(func.sum(Dataset.size_MB), 0),
+        )
+        .group_by(Dataset.database_id)
+        .all()
+    )
+
+    now = datetime.utcnow()
+    DatabaseStats.query.delete()
+    for database_id, n_datasets, n_computed, size_MB in rows:
+        if database_id is None:
+            continue
+        db.session.add(DatabaseStats(
+            database_id=database_id,
+            n_datasets=n_datasets,
+            n_computed=n_computed,
+            size_MB=int(size_MB),
+            updated=now,
+        ))
+    db.session.commit()
+    return rows
+
+
+def totals():
+    """Counters summed over all databases."""
+    n_datasets, n_computed, size_MB = DatabaseStats.query.with_entities(
+        func.coalesce(func.sum(DatabaseStats.n_datasets), 0),
+        func.coalesce(func.sum(DatabaseStats.n_computed), 0),
+        func.coalesce(func.sum(DatabaseStats.size_MB), 0),
+    ).first()
+    return {
+        "n_datasets": int(n_datasets),
+        "n_computed": int(n_computed),
+        "n_pending": int(n_datasets) - int(n_computed),
+        "size_MB": int(size_MB),
+    }
@@ -0,0 +1,358 @@
+"""
+Signature storage.
+
+Backends implement the same small interface (exists, stat, put_stream,
+get_stream, list and presign) over buckets and keys:
+
+- `S3Storage`, for S3 and S3-compatible services
+- `LocalStorage`, a directory per bucket on a local (or shared) filesystem
+
+`get_storage` returns the backend selected in the settings, created once
+per process.
+"""
+import os
+import shutil
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from flask import current_app
+
+# S3 rejects multipart parts smaller than this (except for the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+BUCKETS = {"sra": "wort-sra", "genomes": "wort-genomes", "img": "wort-img"}
+
+# `modified` is a timezone-aware UTC datetime
+ObjectInfo = namedtuple("ObjectInfo", "key size modified")
+
+
+def bucket_for(public_db):
+    return BUCKETS[public_db]
+
+
+def submitted_bucket_for(public_db):
+    return f"wort-submitted-{public_db}"
+
+
+def sig_key(dataset_id):
+    return f"sigs/{dataset_id}.sig"
+
+
+def gzip_chunks(fp, level=9, chunk_size=1024 * 1024):
+    """Compress a file-like object, yielding gzip data as it is produced."""
+    # wbits=16+ produces a gzip container instead of a raw zlib stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    while True:
+        data = fp.read(chunk_size)
+        if not data:
+            break
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def upload_gzip(conn, fp, bucket, key, level=9, part_size=MIN_PART_SIZE, **extra):
+    """
+    Compress `fp` and upload it to `bucket`/`key`, one part at a time.
+
+    At most `part_size` bytes of compressed data are kept in memory. Small
+    files (a single part) are sent with a regular `put_object`. `extra` is
+    passed along to S3 (ContentType, ContentEncoding...).
+
+    Returns the time spent compressing and uploading, and the bytes before
+    and after compression.
+    """
+    part_size = max(part_size, MIN_PART_SIZE)
+
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+    stats = {"bytes_in": 0, "bytes_out": 0, "gzip_seconds": 0.0, "upload_seconds": 0.0}
+
+    reader = _CountingReader(fp)
+
+    def timed(method, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(**kwargs)
+        finally:
+            stats["upload_seconds"] += time.perf_counter() - start
+
+    def send_part():
+        number = len(parts) + 1
+        response = timed(
+            conn.upload_part,
+            Body=bytes(buffer), Bucket=bucket, Key=key,
+            PartNumber=number, UploadId=upload_id,
+        )
+        parts.append({"ETag": response["ETag"], "PartNumber": number})
+        buffer.clear()
+
+    try:
+        chunks = gzip_chunks(reader, level=level)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            stats["gzip_seconds"] += time.perf_counter() - start
+            if chunk is None:
+                break
+
+            stats["bytes_out"] += len(chunk)
+            buffer += chunk
+            if len(buffer) >= part_size:
+                if upload_id is None:
+                    upload_id = timed(
+                        conn.create_multipart_upload, Bucket=bucket, Key=key, **extra
+                    )["UploadId"]
+                send_part()
+
+        stats["bytes_in"] = reader.bytes
+        if upload_id is None:
+            # Everything fit in one part, no need for multipart
+            timed(conn.put_object, Body=bytes(buffer), Bucket=bucket, Key=key, **extra)
+            return stats
+
+        if buffer:
+            send_part()
+        timed(
+            conn.complete_multipart_upload,
+            Bucket=bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+        return stats
+    except Exception:
+        if upload_id is not None:
+            conn.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+class _CountingReader:
+    def __init__(self, fp):
+        self.fp = fp
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        self.bytes += len(data)
+        return data
+
+
+class S3Storage:
+    def __init__(self, client):
+        self.client = client
+
+    def _is_missing(self, error):
+        return error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound")
+
+    def exists(self, bucket, key):
+        return self.stat(bucket, key) is not None
+
+    def stat(self, bucket, key):
+        import botocore
+
+        try:
+            response = self.client.head_object(Bucket=bucket, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return ObjectInfo(key, response["ContentLength"], response["LastModified"])
+
+    def put_stream(self, bucket, key, fp, compress=False, level=9,
+                   part_size=MIN_PART_SIZE, content_type=None, content_encoding=None):
+        """
+        Store the contents of `fp`, gzipped if `compress` is set, without
+        reading it all in memory. Returns the same stats as `upload_gzip`.
+        """
+        extra = {}
+        if content_type is not None:
+            extra["ContentType"] = content_type
+        if content_encoding is not None and not compress:
+            extra["ContentEncoding"] = content_encoding
+
+        if compress:
+            return upload_gzip(self.client, fp, bucket, key, level=level,
+                               part_size=part_size, ContentEncoding="gzip", **extra)
+
+        from boto3.s3.transfer import TransferConfig
+
+        reader = _CountingReader(fp)
+        start = time.perf_counter()
+        self.client.upload_fileobj(
+            reader, bucket, key, ExtraArgs=extra,
+            # one part in memory at a time
+            Config=TransferConfig(
+                multipart_threshold=max(part_size, MIN_PART_SIZE),
+                multipart_chunksize=max(part_size, MIN_PART_SIZE),
+                use_threads=False,
+            ),
+        )
+        return {"bytes_in": reader.bytes, "bytes_out": reader.bytes,
+                "gzip_seconds": 0.0, "upload_seconds": time.perf_counter() - start}
+
+    def get_stream(self, bucket, key):
+        """File-like object with the stored (raw) bytes, or None if missing."""
+        import botocore
+
+        try:
+            return self.client.get_object(Bucket=bucket, Key=key)["Body"]
+        except botocore.exceptions.ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+    def list(self, bucket, prefix="", start_after=None):
+        """Objects under `prefix` in key order, only after `start_after` if given."""
+        paginator = self.client.get_paginator("list_objects_v2")
+        extra = {"StartAfter": start_after} if start_after else {}
+        pages = paginator.paginate(
+            Bucket=bucket, Prefix=prefix, PaginationConfig={"PageSize": 1000}, **extra
+        )
+        for page in pages:
+            for obj in page.get("Contents", []):
+                yield ObjectInfo(obj["Key"], obj["Size"], obj["LastModified"])
+
+    def presign(self, bucket, key, expires, **params):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": key, **params}, ExpiresIn=expires
+        )
+
+
+class LocalStorage:
+    """
+    Buckets are directories under `root`. If `base_url` is set (a web server
+    exposing `root`), `presign` returns plain links under it.
+    """
+
+    def __init__(self, root, base_url=None):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    def _path(self, bucket, key):
+        path = os.path.normpath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.join(self.root, bucket) + os.sep):
+            raise ValueError(f"Invalid key: {key}")
+        return path
+
+    def exists(self, bucket, key):
+        return os.path.isfile(self._path(bucket, key))
+
+    def stat(self, bucket, key):
+        try:
+            st = os.stat(self._path(bucket, key))
+        except FileNotFoundError:
+            return None
+        return ObjectInfo(key, st.st_size, datetime.fromtimestamp(st.st_mtime, tz=timezone.utc))
+
+    def put_stream(self, bucket, key, fp, compress=False, level=9,
+                   part_size=MIN_PART_SIZE, content_type=None, content_encoding=None):
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        reader = _CountingReader(fp)
+        stats = {"bytes_in": 0, "bytes_out": 0, "gzip_seconds": 0.0, "upload_seconds": 0.0}
+        # write to a temp file and rename, so readers never see partial data.
+        # Created like open() does (0666 minus the umask), mkstemp files are
+        # private (0600) and signatures are not
+        tmp_path = os.path.join(os.path.dirname(path), f".tmp-{os.urandom(8).hex()}")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                start = time.perf_counter()
+                if compress:
+                    for chunk in gzip_chunks(reader, level=level):
+                        out.write(chunk)
+                        stats["bytes_out"] += len(chunk)
+                else:
+                    shutil.copyfileobj(reader, out)
+                    stats["bytes_out"] = reader.bytes
+                elapsed = time.perf_counter() - start
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        stats["bytes_in"] = reader.bytes
+        stats["gzip_seconds" if compress else "upload_seconds"] = elapsed
+        return stats
+
+    def get_stream(self, bucket, key):
+        try:
+            return open(self._path(bucket, key), "rb")
+        except FileNotFoundError:
+            return None
+
+    def list(self, bucket, prefix="", start_after=None):
+        bucket_root = os.path.join(self.root, bucket)
+        # only walk the directory containing the prefix
+        start = os.path.join(bucket_root, os.path.dirname(prefix))
+        for dirpath, dirnames, filenames in os.walk(start):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.startswith(".tmp-"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, bucket_root).replace(os.sep, "/")
+                if key.startswith(prefix) and (start_after is None or key > start_after):
+                    st = os.stat(path)
+                    yield ObjectInfo(
+                        key, st.st_size, datetime.fromtimestamp(st.st_mtime, tz=timezone.utc)
+                    )
+
+    def presign(self, bucket, key, expires, **params):
+        if self.base_url is None:
+            return None
+        return f"{self.base_url}/{bucket}/{key}"
+
+
+@lru_cache(maxsize=None)
+def _s3_storage(endpoint_url, access_key_id, secret_access_key, max_pool_connections):
+    import boto3
+    from botocore.config import Config
+
+    # own session, the default one isn't safe to share between threads
+    session = boto3.session.Session()
+    client = session.client(
+        service_name="s3",
+        endpoint_url=endpoint_url,
+        aws_access_key_id=access_key_id,
+        aws_secret_access_key=secret_access_key,
+        region_name="auto" if endpoint_url else None,
+        config=Config(
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=True,
+            retries={"max_attempts": 3, "mode": "standard"},
+        ),
+    )
+    return S3Storage(client)
+
+
+@lru_cache(maxsize=None)
+def _local_storage(root, base_url):
+    return LocalStorage(root, base_url)
+
+
+def get_storage(public=False):
+    """
+    Storage backend for this process, as selected by STORAGE_BACKEND.
+
+    With the S3 backend, `public` selects the service signatures are served
+    from (SIG_STORAGE_*), instead of the one workers write to.
+    """
+    config = current_app.config
+    if config["STORAGE_BACKEND"] == "local":
+        return _local_storage(config["STORAGE_LOCAL_ROOT"], config["STORAGE_LOCAL_URL"])
+
+    if public:
+        return _s3_storage(
+            config["SIG_STORAGE_ENDPOINT_URL"],
+            config["SIG_STORAGE_ACCESS_KEY_ID"],
+            config["SIG_STORAGE_SECRET_ACCESS_KEY"],
+            config["SIG_STORAGE_MAX_POOL"],
+        )
+    return _s3_storage(config["STORAGE_ENDPOINT_URL"], None, None, config["SIG_STORAGE_MAX_POOL"])